@@ -1,25 +1,35 @@
 import json
 
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
 from django.utils.safestring import mark_safe
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
 from pygments.lexers import JsonLexer
 
-from main.models import Article, Target, UserTarget
+from main.models import APIService, Article, Metric, NLUCacheEntry, SentimentReport, Target, UserTarget
 
 
 class ArticleAdmin(admin.ModelAdmin):
     list_display = ['id', 'source', 'title', 'published_at', 'url', 'created_at']
-    readonly_fields = list_display + ['uid', 'snippet', 'sentiment_data_pretty']
+    readonly_fields = list_display + ['uid', 'snippet', 'duplicate_of', 'sentiment_data_pretty']
     fieldsets = [
         ('Article info', {'fields': ['title', ('source', 'url'), 'snippet', 'published_at']}),
-        ('Storage info', {'fields': [('id', 'uid', 'created_at')]}),
+        ('Storage info', {'fields': [('id', 'uid', 'created_at'), 'duplicate_of']}),
         ('Sentiment analysis', {'fields': ['sentiment_data_pretty']}),
         ]
     list_filter = ('source', )
     search_fields = ('uid',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Full-text search of the title and snippet, or exact uid"""
+        if not search_term:
+            return queryset, False
+        query = SearchQuery(search_term, config=settings.SEARCH_CONFIG)
+        return queryset.filter(Q(search_vector=query) | Q(uid=search_term)), False
+
     def sentiment_data_pretty(self, instance):
         """Function to display pretty version of the sentiment data"""
 
@@ -43,7 +53,8 @@ class ArticleAdmin(admin.ModelAdmin):
 
 
 class TargetAdmin(admin.ModelAdmin):
-    list_display = ['active', 'keyword', 'refresh_frequency', 'expired_at', 'created_at']
+    list_display = ['active', 'keyword', 'refresh_frequency', 'refresh_interval', 'last_yield',
+                    'expired_at', 'created_at']
     list_filter = ('active', )
 
 
@@ -51,6 +62,30 @@ class UserTargetAdmin(admin.ModelAdmin):
     list_display = ['user', 'target_keyword', 'created_at']
 
 
+class SentimentReportAdmin(admin.ModelAdmin):
+    list_display = ['article', 'target_keyword', 'target_keyword_score', 'global_score',
+                    'published_at', 'created_at']
+    raw_id_fields = ('article', )
+
+
+class NLUCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['key', 'hits', 'created_at']
+    search_fields = ('key',)
+
+
+class APIServiceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'tokens', 'refilled_at', 'granted', 'throttled', 'failures', 'opened_at']
+
+
+class MetricAdmin(admin.ModelAdmin):
+    list_display = ['name', 'labels', 'value']
+    search_fields = ('name', 'labels')
+
+
 admin.site.register(Article, ArticleAdmin)
 admin.site.register(Target, TargetAdmin)
 admin.site.register(UserTarget, UserTargetAdmin)
+admin.site.register(SentimentReport, SentimentReportAdmin)
+admin.site.register(NLUCacheEntry, NLUCacheEntryAdmin)
+admin.site.register(APIService, APIServiceAdmin)
+admin.site.register(Metric, MetricAdmin)
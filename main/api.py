@@ -1,9 +1,15 @@
+from django.conf import settings
+from django.contrib.postgres.fields.jsonb import KeyTransform
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
 from rest_framework import authentication, permissions
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from main.models import Article, UserTarget
+from main.models import Article, SentimentReport, UserTarget
+from main.pagination import KeysetPagination, SearchPagination
 from main.serializers import ArticleSerializer, UserTargetSerializer
 
 
@@ -36,14 +42,86 @@ class APIUserTarget(APIView):
 
 
 class APIArticle(APIView):
+    """
+    Articles of the user keywords, newest first, paginated by cursor: the page
+    is a list of articles and the next page is linked by the Link header.
+    Query parameters:
+    - cursor: the position given by the `next` link of the previous page
+    - limit: the page size
+    - fields: comma separated list of the fields to return (400 if any is
+      not a field of ArticleSerializer)
+    - compact: if set returns only the latest report (`last_report`) instead
+      of the whole `sentiment_data` history
+    """
 
     authentication_classes = (authentication.SessionAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
+    default_fields = ('url', 'title', 'snippet', 'source', 'published_at', 'sentiment_data')
+    compact_fields = ('url', 'title', 'snippet', 'source', 'published_at', 'last_report')
+
     def get(self, request, **kwargs):
-        user_keywords = list(request.user.my_targets.all().values_list(
-            'target_keyword__keyword', flat=True))
+        fields = self.get_fields(request)
+        user_articles = self.get_user_articles(request, fields)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(user_articles, request, view=self)
+        serializer = ArticleSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_fields(self, request):
+        if 'fields' in request.query_params:
+            fields = request.query_params['fields'].split(',')
+            unknown = [field for field in fields if field not in ArticleSerializer.Meta.fields]
+            if unknown:
+                raise ValidationError(
+                    {'fields': ['Unknown fields: %s.' % ', '.join("'%s'" % field for field in unknown)]})
+            return fields
+        elif request.query_params.get('compact'):
+            return self.compact_fields
+        return self.default_fields
+
+    def get_user_articles(self, request, fields):
+        user_targets = list(request.user.my_targets.all().values_list(
+            'target_keyword', flat=True))
         user_articles = Article.objects.filter(
-            sentiment_data__reports__0__target_keyword__in=user_keywords)
-        serializer = ArticleSerializer(user_articles, many=True)
-        return Response(serializer.data)
+            id__in=SentimentReport.objects.filter(
+                target_keyword__in=user_targets).values('article'))
+
+        # only load the columns needed, the sentiment_data blob above all
+        model_fields = set(self.default_fields) & set(fields)
+        user_articles = user_articles.only('id', 'published_at', *model_fields)
+        if 'last_report' in fields:
+            user_articles = user_articles.annotate(
+                last_report=KeyTransform('0', KeyTransform('reports', 'sentiment_data')))
+        return user_articles
+
+
+class APIArticleSearch(APIArticle):
+    """
+    Articles of the user keywords matching the words of `q` in their title
+    or snippet, the most relevant first, paginated by limit/offset (next page
+    in the Link header).
+    Query parameters:
+    - q: the words searched
+    - limit, offset: the page size and position
+    - fields, compact: as for APIArticle
+    """
+
+    def get(self, request, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response({'q': ['This parameter is required.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fields = self.get_fields(request)
+        query = SearchQuery(request.query_params['q'], config=settings.SEARCH_CONFIG)
+        # matched through the GIN index, only the matches are ranked
+        user_articles = self.get_user_articles(request, fields)\
+            .filter(search_vector=query)\
+            .annotate(rank=SearchRank(F('search_vector'), query))\
+            .order_by('-rank', '-published_at', '-id')
+
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(user_articles, request, view=self)
+        serializer = ArticleSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
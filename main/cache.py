@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+from url_normalize import url_normalize
+
+from main.models import DailySentiment, NLUCacheEntry, SentimentReport
+
+log = logging.getLogger(__name__)
+
+
+class NLUResponseCache(object):
+    """
+    Database cache of the NLU responses keyed by the normalized article url and
+    the set of target keywords, so re-queued or re-titled articles don't cost
+    another analysis.
+    Entries expire after NLU_CACHE_TTL hours and only the newest
+    NLU_CACHE_MAX_ENTRIES are kept by purge()
+    """
+
+    def __init__(self):
+        # counters of this process, the hits of each entry are stored in the db too
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(url, keywords):
+        signature = url_normalize(url) + '\n' + '\n'.join(sorted(set(kw.lower() for kw in keywords)))
+        return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+    def get(self, url, keywords):
+        """
+        Returns the cached response or None if missing or expired
+        """
+        key = self.get_key(url, keywords)
+        expired_at = timezone.now() - timedelta(hours=settings.NLU_CACHE_TTL)
+        entry = NLUCacheEntry.objects.filter(key=key, created_at__gt=expired_at)\
+            .values_list('id', 'response').first()
+
+        if entry is None:
+            self.misses += 1
+            return
+
+        self.hits += 1
+        NLUCacheEntry.objects.filter(id=entry[0]).update(hits=F('hits') + 1)
+        return entry[1]
+
+    def set(self, url, keywords, response):
+        NLUCacheEntry.objects.update_or_create(key=self.get_key(url, keywords),
+                                               defaults={'response': response,
+                                                         'created_at': timezone.now()})
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process and the number of
+        remote calls saved overall
+        """
+        saved_calls = NLUCacheEntry.objects.aggregate(saved=Sum('hits'))['saved'] or 0
+        return {'hits': self.hits, 'misses': self.misses, 'saved_calls': saved_calls}
+
+    @staticmethod
+    def purge():
+        """
+        Deletes the expired entries and the oldest ones exceeding the maximum size
+        """
+        expired_at = timezone.now() - timedelta(hours=settings.NLU_CACHE_TTL)
+        deleted, _ = NLUCacheEntry.objects.filter(created_at__lte=expired_at).delete()
+
+        oldest_kept = NLUCacheEntry.objects.order_by('-created_at')\
+            .values_list('created_at', flat=True)[settings.NLU_CACHE_MAX_ENTRIES - 1:settings.NLU_CACHE_MAX_ENTRIES]
+        if oldest_kept:
+            evicted, _ = NLUCacheEntry.objects.filter(created_at__lt=oldest_kept[0]).delete()
+            deleted += evicted
+
+        log.debug("purged %d NLU cache entries" % deleted)
+        return deleted
+
+
+class RecentUIDs(object):
+    """
+    In-process memory of the article uids stored in the last INGEST_RECENT_UIDS_TTL
+    seconds (up to INGEST_RECENT_UIDS_MAX_SIZE of them), so the articles returned
+    again by the next scrapes are dropped before reaching the db
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl if ttl is not None else settings.INGEST_RECENT_UIDS_TTL
+        self.max_size = max_size or settings.INGEST_RECENT_UIDS_MAX_SIZE
+        self._uids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, uids):
+        """
+        Returns the given uids not seen recently
+        """
+        with self._lock:
+            self._expire()
+            return [uid for uid in uids if uid not in self._uids]
+
+    def add(self, uids):
+        with self._lock:
+            now = time.monotonic()
+            for uid in uids:
+                self._uids.pop(uid, None)
+                self._uids[uid] = now
+            while len(self._uids) > self.max_size:
+                self._uids.popitem(last=False)
+
+    def _expire(self):
+        expired_at = time.monotonic() - self.ttl
+        while self._uids and next(iter(self._uids.values())) <= expired_at:
+            self._uids.popitem(last=False)
+
+
+def _keyword_cache_key(kind, target_id, reports_updated_at):
+    """
+    The keys are versioned by the time of the last report stored for the
+    keyword, so a new report invalidates the entries of every process
+    """
+    version = reports_updated_at.timestamp() if reports_updated_at else 0
+    return 'kw:%s:%d:%f' % (kind, target_id, version)
+
+
+def get_keyword_feeds(targets):
+    """
+    Returns the dashboard data of each of the given (target id, reports_updated_at)
+    target keywords, shared by all the users of the keyword:
+    {target id: {'feed': [(published_at, report id), ..], 'average': (score, count)}}
+    with the latest DASHBOARD_FEED_SIZE reports and their average target score
+    """
+    keys = {_keyword_cache_key('feed', target_id, updated_at): target_id
+            for target_id, updated_at in targets}
+    cached = cache.get_many(keys.keys())
+
+    feeds = {}
+    for key, target_id in keys.items():
+        if key not in cached:
+            rows = SentimentReport.objects.filter(target_keyword=target_id)\
+                .values_list('published_at', 'id', 'target_keyword_score')[:settings.DASHBOARD_FEED_SIZE]
+            scores = [score for _, _, score in rows if score is not None]
+            cached[key] = {'feed': [(published_at, pk) for published_at, pk, _ in rows],
+                           'average': (sum(scores) / len(scores) if scores else 0, len(scores))}
+            cache.set(key, cached[key], settings.DASHBOARD_CACHE_TIMEOUT)
+        feeds[target_id] = cached[key]
+    return feeds
+
+
+def get_keyword_trends(targets, since):
+    """
+    Returns the (day, average score) data points from the given day onwards of
+    each of the given (target id, reports_updated_at) target keywords:
+    {target id: [(day, score), ..]}
+    """
+    keys = {_keyword_cache_key('trend:%s' % since, target_id, updated_at): target_id
+            for target_id, updated_at in targets}
+    cached = cache.get_many(keys.keys())
+
+    trends = {}
+    for key, target_id in keys.items():
+        if key not in cached:
+            data = DailySentiment.get_score_data([target_id], since)
+            cached[key] = next(iter(data.values()), [])
+            cache.set(key, cached[key], settings.DASHBOARD_CACHE_TIMEOUT)
+        trends[target_id] = cached[key]
+    return trends
@@ -0,0 +1,141 @@
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from main.metrics import metrics
+from main.models import APIService
+
+log = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt):
+    """
+    Seconds before the given retry (from 0) of a failed call: exponential from
+    API_RETRY_BASE_DELAY up to API_RETRY_MAX_DELAY, with a random jitter so the
+    tasks failed together are not retried together
+    """
+    delay = min(settings.API_RETRY_BASE_DELAY * 2 ** attempt, settings.API_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.5, 1)
+
+
+class ServiceUnavailable(Exception):
+    """
+    Raised when an API call can't be made now, retry_after is the minimum
+    number of seconds before retrying it
+    """
+
+    def __init__(self, service, retry_after, message=None):
+        super(ServiceUnavailable, self).__init__(message or '%s unavailable, retry in %.1fs' %
+                                                 (service, retry_after))
+        self.service = service
+        self.retry_after = retry_after
+
+    def retry_delay(self, attempt):
+        """
+        Seconds before the given retry (from 0) of the task that failed
+        """
+        return max(self.retry_after, backoff_delay(attempt))
+
+
+class ServiceFailure(ServiceUnavailable):
+    """
+    Raised when an API call failed because of the service (server error, timeout,
+    connection error...), so it's worth retrying it later
+    """
+
+    def __init__(self, service, error):
+        super(ServiceFailure, self).__init__(service, 0, '%s call failed: %s' % (service, error))
+
+
+class CircuitOpen(ServiceUnavailable):
+    """
+    Raised instead of calling an API whose circuit breaker is open
+    """
+
+    def __init__(self, service, retry_after):
+        super(CircuitOpen, self).__init__(service, retry_after, '%s circuit open, retry in %.1fs' %
+                                          (service, retry_after))
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of an API shared by all the processes through its APIService
+    row: API_CIRCUIT_FAILURES consecutive failures open the circuit and the calls
+    are rejected with CircuitOpen until, API_CIRCUIT_OPEN_SECONDS later, a single
+    probe call is let through. The circuit closes if the probe succeeds and opens
+    again if it fails
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # failures seen by the last check of each thread: the successes only
+        # write to the db to reset them
+        self._local = threading.local()
+
+    def allow(self):
+        """
+        Raises CircuitOpen if the API must not be called now
+        """
+        now = timezone.now()
+        service = APIService.objects.filter(name=self.name)\
+            .values('failures', 'opened_at', 'probe_at').first()
+        self._local.failing = bool(service and (service['failures'] or service['opened_at']))
+        self._local.probe_at = None
+        if not service or service['opened_at'] is None:
+            return
+
+        open_for = timedelta(seconds=settings.API_CIRCUIT_OPEN_SECONDS)
+        if now < service['opened_at'] + open_for:
+            self._reject((service['opened_at'] + open_for - now).total_seconds())
+
+        # half open: a single probe at a time, claimed atomically, or another one
+        # if the previous probe never reported back
+        probing = APIService.objects.filter(name=self.name, opened_at=service['opened_at'])\
+            .filter(Q(probe_at__isnull=True) | Q(probe_at__lte=now - open_for))\
+            .update(probe_at=now)
+        if not probing:
+            self._reject(settings.API_CIRCUIT_OPEN_SECONDS)
+        self._local.probe_at = now
+        log.debug("%s circuit half open: probing" % self.name)
+
+    def release_probe(self):
+        """
+        Gives up the probe claimed by the last allow() of this thread, if any, when
+        the call is not made after all (e.g. rate limit exceeded), so that another
+        call can probe the API right away
+        """
+        probe_at = getattr(self._local, 'probe_at', None)
+        if probe_at:
+            APIService.objects.filter(name=self.name, probe_at=probe_at).update(probe_at=None)
+            self._local.probe_at = None
+
+    def record_success(self):
+        if getattr(self._local, 'failing', True):
+            APIService.objects.filter(name=self.name).update(failures=0, opened_at=None, probe_at=None)
+            self._local.failing = False
+
+    def record_failure(self):
+        """
+        Counts a failed call, opening the circuit once there have been
+        API_CIRCUIT_FAILURES in a row (or if the probe failed)
+        """
+        now = timezone.now()
+        if self.name in settings.API_RATE_LIMITS:
+            # as created by the rate limiter
+            APIService.objects.get_or_create(name=self.name, defaults={
+                'tokens': settings.API_RATE_LIMITS[self.name][1], 'refilled_at': now})
+        APIService.objects.filter(name=self.name).update(
+            failures=F('failures') + 1,
+            opened_at=Case(When(Q(failures__gte=settings.API_CIRCUIT_FAILURES - 1) | Q(opened_at__isnull=False),
+                                then=Value(now)), default=F('opened_at')),
+            probe_at=None)
+        self._local.failing = True
+
+    def _reject(self, retry_after):
+        metrics.inc('mkrk_api_rejected_total', api=self.name)
+        raise CircuitOpen(self.name, retry_after)
@@ -0,0 +1,234 @@
+"""
+Stand-ins of the NewsAPI and IBM NLU clients to load test the pipeline without
+calling the paid APIs. They replay the responses recorded by RecordingClient in a
+JSON lines file (one {"api", "method", "params", "response"} object per line) and
+generate a plausible response for the calls not recorded, with a configurable
+latency and error rate
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from newsapi.newsapi_exception import NewsAPIException
+from watson_developer_cloud import WatsonApiException
+from watson_developer_cloud.watson_service import DetailedResponse
+
+WORDS = ('market shares growth profit loss deal launch users report investors record '
+         'strong weak surge plunge lawsuit upgrade outage revenue quarter product').split()
+
+
+def load_recording(path):
+    """
+    Returns the recorded responses of the given JSON lines file grouped by
+    api and call signature
+    """
+    recorded = {}
+    if not path:
+        return recorded
+    with open(path) as recording:
+        for line in recording:
+            if line.strip():
+                call = json.loads(line)
+                key = _signature(call['api'], call['method'], call['params'])
+                recorded.setdefault(key, []).append(call['response'])
+    return recorded
+
+
+def _signature(api, method, params):
+    if api == 'nlu':
+        # the analyses are replayed by article, whatever the features requested
+        params = {'url': params.get('url')}
+    else:
+        params = {name: value for name, value in params.items() if name in ('q', 'page', 'from_param')}
+    return '%s.%s:%s' % (api, method, json.dumps(params, sort_keys=True))
+
+
+def _to_json(value):
+    if hasattr(value, '_to_dict'):
+        return value._to_dict()
+    return str(value)
+
+
+class FakeClient(object):
+    """
+    Base class of the fake clients: replays the recorded responses (in turn if
+    a call has been recorded several times), sleeps latency seconds (+/- 50%)
+    and fails error_rate of the calls, raising failure (the usual error of the
+    API if not given). The latency of every call is kept in call_latencies
+    """
+    api = None
+
+    def __init__(self, recording=None, latency=0.0, error_rate=0.0, seed=0, failure=None):
+        self.recorded = load_recording(recording) if isinstance(recording, str) else (recording or {})
+        self.latency = latency
+        self.error_rate = error_rate
+        self.failure = failure
+        self.random = random.Random(seed)
+        self.call_latencies = []
+        self._replayed = {}
+        self._lock = threading.Lock()
+
+    def _call(self, method, params, generate):
+        started = time.perf_counter()
+        with self._lock:
+            delay = self.latency * self.random.uniform(0.5, 1.5) if self.latency else 0
+            failed = self.random.random() < self.error_rate
+            key = _signature(self.api, method, params)
+            responses = self.recorded.get(key)
+            if responses:
+                index = self._replayed.get(key, 0)
+                self._replayed[key] = index + 1
+                response = responses[index % len(responses)]
+            else:
+                response = None
+        if delay:
+            time.sleep(delay)
+        try:
+            if failed:
+                self._fail()
+            return response if response is not None else generate()
+        finally:
+            with self._lock:
+                self.call_latencies.append(time.perf_counter() - started)
+
+    def _fail(self):
+        raise self.failure if self.failure is not None else self.default_failure()
+
+    @staticmethod
+    def default_failure():
+        return requests.ConnectionError('fake connection error')
+
+
+class FakeNewsApiClient(FakeClient):
+    """
+    Stand-in of newsapi.NewsApiClient generating articles_per_call articles
+    containing the query for the calls not recorded
+    """
+    api = 'newsapi'
+
+    def __init__(self, articles_per_call=20, **kwargs):
+        super(FakeNewsApiClient, self).__init__(**kwargs)
+        self.articles_per_call = articles_per_call
+
+    def get_top_headlines(self, **params):
+        return self._call('get_top_headlines', params, lambda: self._generate(params))
+
+    def get_everything(self, **params):
+        return self._call('get_everything', params, lambda: self._generate(params))
+
+    @staticmethod
+    def default_failure():
+        return NewsAPIException({'status': 'error', 'code': 'unexpectedError',
+                                 'message': 'fake error'})
+
+    def _generate(self, params):
+        query = params.get('q') or 'news'
+        page = params.get('page') or 1
+        published_at = datetime.utcnow()
+        if params.get('from_param'):
+            published_at = datetime.strptime(params['from_param'][:10], '%Y-%m-%d')
+
+        articles = []
+        for index in range(self.articles_per_call):
+            with self._lock:
+                words = self.random.sample(WORDS, 8)
+            articles.append({
+                'source': {'id': 'fake', 'name': 'Fake news'},
+                'title': '%s %s' % (query, ' '.join(words[:4])),
+                'content': '%s %s %s' % (' '.join(words[4:]), query, ' '.join(words)),
+                'url': 'https://fake.example.com/%s/%d/%d/%s' % (
+                    query.replace(' ', '-'), page, index, '-'.join(words[:3])),
+                'publishedAt': (published_at + timedelta(minutes=index)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            })
+        return {'status': 'ok', 'totalResults': len(articles), 'articles': articles}
+
+
+class FakeNLUClient(FakeClient):
+    """
+    Stand-in of watson_developer_cloud.NaturalLanguageUnderstandingV1 scoring the
+    articles not recorded with pseudo random scores derived from their url
+    """
+    api = 'nlu'
+
+    def analyze(self, **params):
+        return DetailedResponse(self._call('analyze', params, lambda: self._generate(params)),
+                                status_code=200)
+
+    @staticmethod
+    def default_failure():
+        return WatsonApiException(500, 'fake error')
+
+    @staticmethod
+    def _generate(params):
+        url = params.get('url', '')
+        seed = int(hashlib.md5(url.encode('utf-8')).hexdigest()[:8], 16)
+        scores = random.Random(seed)
+
+        targets = []
+        features = params.get('features')
+        if features is not None and features.sentiment is not None:
+            targets = features.sentiment.targets or []
+
+        return {'sentiment': {'document': {'score': round(scores.uniform(-1, 1), 6)},
+                              'targets': [{'text': target, 'score': round(scores.uniform(-1, 1), 6)}
+                                          for target in targets]},
+                'keywords': [{'text': word, 'sentiment': {'score': round(scores.uniform(-1, 1), 6)},
+                              'relevance': round(scores.random(), 6)}
+                             for word in scores.sample(WORDS, 3)],
+                'retrieved_url': url,
+                'language': 'en'}
+
+
+class RecordingClient(object):
+    """
+    Wraps a real client appending every call and its response to the given
+    JSON lines file, to be replayed later by the fake clients
+    """
+
+    def __init__(self, client, api, path):
+        self.client = client
+        self.api = api
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def record(**params):
+            response = method(**params)
+            result = response.get_result() if hasattr(response, 'get_result') else response
+            line = json.dumps({'api': self.api, 'method': name, 'params': params,
+                               'response': result}, default=_to_json)
+            with self._lock:
+                with open(self.path, 'a') as recording:
+                    recording.write(line + '\n')
+            return response
+        return record
+
+
+class NoRateLimit(object):
+    """
+    Stand-in of RateLimiter never waiting
+    """
+
+    def acquire(self, max_wait=None):
+        pass
+
+
+class NoCircuitBreaker(object):
+    """
+    Stand-in of CircuitBreaker never opening
+    """
+
+    def allow(self):
+        pass
+
+    def record_success(self):
+        pass
+
+    def record_failure(self):
+        pass
@@ -1,19 +1,45 @@
 import logging
-from datetime import datetime
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from django.conf import settings
-from newsapi import NewsApiClient
+from django.utils import timezone
 from url_normalize import url_normalize
-from watson_developer_cloud import NaturalLanguageUnderstandingV1
-from watson_developer_cloud import WatsonApiException
-from watson_developer_cloud.natural_language_understanding_v1 import Features
-from watson_developer_cloud.natural_language_understanding_v1 import KeywordsOptions
-from watson_developer_cloud.natural_language_understanding_v1 import SentimentOptions
 
-from main.models import Article
+from main.cache import NLUResponseCache, RecentUIDs
+from main.circuit import CircuitBreaker, ServiceFailure
+from main.live import notify_reports
+from main.matcher import KeywordMatcher
+from main.metrics import LAG_BUCKETS, metrics
+from main.models import Article, SentimentReport
+from main.ratelimit import RateLimiter, RateLimitExceeded
+from main.sessions import use_pooled_session
+from main.utils import closing_db_connection, locked_cached_property, minhash, minhash_bands
 
 log = logging.getLogger(__name__)
 
+# the API SDKs (and numpy for the local analyzer) are slow to import, so they are
+# only imported by the processes actually calling the APIs, on first use
+
+# NewsAPI errors of the request itself, which won't go away by retrying it
+# (maximumResultsReached: result page beyond the limit of the plan)
+NEWSAPI_REQUEST_ERRORS = ('parameterInvalid', 'parametersMissing', 'sourcesTooMany', 'sourceDoesNotExist',
+                          'maximumResultsReached')
+
+
+def start_call(circuit_breaker, rate_limiter):
+    """
+    Checks the circuit breaker of an API and then waits for its rate limit,
+    giving up the probe claimed by the circuit breaker if the call can't be made
+    """
+    circuit_breaker.allow()
+    try:
+        rate_limiter.acquire()
+    except RateLimitExceeded:
+        circuit_breaker.release_probe()
+        raise
+
 
 class NewsAPIScraper(object):
     """
@@ -23,13 +49,25 @@ class NewsAPIScraper(object):
     """
 
     def __init__(self):
-        self.api_client = NewsApiClient(api_key=settings.NEWSAPIORG_APIKEY)
+        self.rate_limiter = RateLimiter('newsapi')
+        self.circuit_breaker = CircuitBreaker('newsapi')
+        self.recent_uids = RecentUIDs()
         self.default_params = (('sources', 'cnn,bbc-news,business-insider,'
                                            'ars-technica,techcrunch'),
                                ('language', 'en'),
                                ('page_size', 100),
                                )
 
+    @locked_cached_property
+    def api_client(self):
+        """
+        NewsAPI client, built on first use and then reused by all the calls
+        """
+        from newsapi import NewsApiClient, newsapi_client
+
+        use_pooled_session(newsapi_client)
+        return NewsApiClient(api_key=settings.NEWSAPIORG_APIKEY)
+
     def fetch_and_store(self, query=None, upto_date=None):
         """
         Method to call to fetch the news article and store them in the db.
@@ -42,7 +80,98 @@ class NewsAPIScraper(object):
             raw_articles = self._get_headline_news(query=query)
 
         parsed_articles = self._parse_results(raw_articles)
-        return self._store_results(parsed_articles) or []
+        new_uids = self._store_results(parsed_articles) or []
+        self._count_articles(query, parsed_articles, new_uids)
+        return new_uids
+
+    def fetch_and_match(self, keywords):
+        """
+        Method to call to fetch the latest headlines of all the sources with a
+        single query, store them in the db and tag the new articles with the
+        given keywords found in their title or snippet.
+        Returns the list of (article uid, keyword) matches
+        """
+        raw_articles = self._get_headline_news()
+
+        parsed_articles = self._parse_results(raw_articles)
+        new_uids = self._store_results(parsed_articles) or []
+        self._count_articles(None, parsed_articles, new_uids)
+
+        matcher = KeywordMatcher(keywords)
+        matches = []
+        for uid in new_uids:
+            article = parsed_articles[uid]
+            for keyword in matcher.match(article.title, article.snippet):
+                matches += (uid, keyword),
+        return matches
+
+    def backfill_and_store(self, target):
+        """
+        Method to call to fetch all the articles of the last NEWSAPI_BACKFILL_DAYS
+        days for the given target and store them in the db.
+        The window is split in daily slices fetched in parallel, each walking
+        all its result pages. The slices are stored from the most recent day
+        backwards and the last complete day is checkpointed on the target, so an
+        interrupted backfill resumes from there.
+        Yields the set of new articles uids of each slice; the checkpoint is
+        saved once the caller has consumed them
+        """
+        window_end = target.created_at.date()
+        window_start = window_end - timedelta(days=settings.NEWSAPI_BACKFILL_DAYS)
+        if target.backfilled_until:
+            window_end = target.backfilled_until - timedelta(days=1)
+
+        days = [window_end - timedelta(days=n)
+                for n in range((window_end - window_start).days + 1)]
+        if not days:
+            return
+
+        with ThreadPoolExecutor(max_workers=settings.NEWSAPI_BACKFILL_WORKERS) as executor:
+            slices = [executor.submit(closing_db_connection(self._get_day_news), day, target.keyword)
+                      for day in days]
+            try:
+                for day, raw_slice in zip(days, slices):
+                    # a failed slice raises ServiceFailure: the task retries the backfill from it
+                    pages = raw_slice.result()
+                    new_uids = set()
+                    for raw_articles in pages:
+                        parsed_articles = self._parse_results(raw_articles)
+                        page_uids = self._store_results(parsed_articles) or set()
+                        self._count_articles(target.keyword, parsed_articles, page_uids)
+                        new_uids |= page_uids
+                    yield new_uids
+
+                    target.backfilled_until = day
+                    target.save(update_fields=['backfilled_until'])
+            finally:
+                # don't waste API calls on the slices not started yet
+                for pending in slices:
+                    pending.cancel()
+
+    def _get_day_news(self, day, query=None):
+        """
+        Fetch all the result pages of the articles published on the given day.
+        Returns the list of the pages responses, up to the first page rejected by
+        NewsAPI (e.g. a day or a page beyond the limits of the plan), which won't
+        be accepted by retrying it either. Raises ServiceFailure if a call failed
+        """
+        page_size = dict(self.default_params)['page_size']
+        from_date = datetime.combine(day, datetime.min.time())
+        to_date = datetime.combine(day, datetime.max.time())
+
+        pages = []
+        for page in range(1, settings.NEWSAPI_MAX_PAGES + 1):
+            response = self._get_all_news(from_date, query=query, to_date=to_date, page=page)
+            if response is None:
+                log.error('%s page %d of %s rejected, skipped' % (query, page, day))
+                break
+            if response.get('status', None) != 'ok':
+                raise ServiceFailure('newsapi', 'unexpected response for %s page %d of %s' % (query, page, day))
+            pages.append(response)
+
+            if page * page_size >= response.get('totalResults', 0):
+                break
+        return pages
 
     def _get_headline_news(self, query=None):
         """
@@ -53,34 +182,70 @@ class NewsAPIScraper(object):
         if query:
             params['q'] = query
 
+        start_call(self.circuit_breaker, self.rate_limiter)
         try:
-            response = self.api_client.get_top_headlines(**params)
+            with metrics.timer('mkrk_api_call_seconds', api='newsapi'):
+                response = self.api_client.get_top_headlines(**params)
         except Exception as e:
+            metrics.inc('mkrk_api_errors_total', api='newsapi')
             log.error('%s %s' % (e, params))
+            self._raise_service_failure(e)
         else:
+            self.circuit_breaker.record_success()
             # print(json.dumps(response, indent=2))
             return response
 
-    def _get_all_news(self, upto_date, query=None):
+    def _get_all_news(self, upto_date, query=None, to_date=None, page=None):
         """
-        Fetch the all the articles up to upto_date using the default params
-        and the given query
+        Fetch the all the articles up to upto_date (and until to_date if given)
+        using the default params, the given query and the result page
         refer to https://newsapi.org/docs for the available parameters
         """
         params = dict(self.default_params)
         if query:
             params['q'] = query
 
-        params['from_param'] = upto_date.strftime("%Y-%m-%d")
+        params['from_param'] = upto_date.strftime("%Y-%m-%dT%H:%M:%S")
+        if to_date:
+            params['to'] = to_date.strftime("%Y-%m-%dT%H:%M:%S")
+        if page:
+            params['page'] = page
 
+        start_call(self.circuit_breaker, self.rate_limiter)
         try:
-            response = self.api_client.get_everything(**params)
+            with metrics.timer('mkrk_api_call_seconds', api='newsapi'):
+                response = self.api_client.get_everything(**params)
         except Exception as e:
+            metrics.inc('mkrk_api_errors_total', api='newsapi')
             log.error('%s %s' % (e, params))
+            self._raise_service_failure(e)
         else:
+            self.circuit_breaker.record_success()
             # print(json.dumps(response, indent=2))
             return response
 
+    def _raise_service_failure(self, e):
+        """
+        Raises ServiceFailure, to retry later, unless the request itself was wrong.
+        Anything else is a failure of the service, including the error pages which
+        are not JSON (ValueError raised by the client)
+        """
+        from newsapi.newsapi_exception import NewsAPIException
+
+        if isinstance(e, NewsAPIException) and e.get_code() in NEWSAPI_REQUEST_ERRORS:
+            # the service is up though
+            self.circuit_breaker.record_success()
+            return
+        self.circuit_breaker.record_failure()
+        raise ServiceFailure('newsapi', e)
+
+    @staticmethod
+    def _count_articles(keyword, parsed_articles, new_uids):
+        fetched = len(parsed_articles or [])
+        metrics.inc('mkrk_articles_fetched_total', fetched, keyword=keyword or '')
+        metrics.inc('mkrk_articles_new_total', len(new_uids), keyword=keyword or '')
+        metrics.inc('mkrk_articles_duplicate_total', fetched - len(new_uids), keyword=keyword or '')
+
     @staticmethod
     def _parse_results(articles):
         if not articles or articles.get('status', None) != 'ok':
@@ -100,82 +265,112 @@ class NewsAPIScraper(object):
                 log.error(e)
                 continue
             snippet = entry.get('content', None)
+            # a title alone is too short to fingerprint: the article is always analyzed
+            fingerprint = minhash(title, snippet, min_shingles=settings.DUPLICATE_MIN_SHINGLES) if snippet else None
 
             article = Article(url=url, title=title, snippet=snippet,
-                              source=source, published_at=published_at)
+                              source=source, published_at=published_at,
+                              fingerprint=fingerprint,
+                              fingerprint_bands=minhash_bands(fingerprint))
             result[article.uid] = article
 
         return result
 
-    @staticmethod
-    def _store_results(parsed_articles):
+    def _store_results(self, parsed_articles):
         if not parsed_articles:
             return
 
-        uids_to_check = parsed_articles.keys()
-        uids_existing = Article.objects.filter(uid__in=uids_to_check)\
-            .values_list('uid', flat=True)
-        uids_new = set(uids_to_check) - set(uids_existing)
+        # the articles stored by the recent scrapes are skipped without querying the db
+        new_articles = [parsed_articles[uid] for uid in self.recent_uids.filter(parsed_articles.keys())]
+        uids_new = Article.insert_new(new_articles) if new_articles else set()
+        self.recent_uids.add(parsed_articles.keys())
 
-        new_articles = [parsed_articles[uid] for uid in uids_new]
-
-        if new_articles:
-            Article.objects.bulk_create(new_articles)
+        if uids_new:
             # return the new articles uids
             return uids_new
 
 
-class NewsNLUAnalyzer(object):
+class BaseAnalyzer(ABC):
     """
-    IBM Natural Language Understanding analayzer class
-    Check the documentation at
-    https://cloud.ibm.com/apidocs/natural-language-understanding
-    for all the features and parameters available
+    Base class of the sentiment analyzers: _analyze returns the analysis of an
+    article in the format of the IBM NLU responses, so all of them are parsed and
+    stored in the same way
     """
+    # the analyses are done by a remote service: worth running them concurrently
+    # and reusing the reports of the near duplicates instead
+    remote = False
 
-    def __init__(self):
-        self.api_client = NaturalLanguageUnderstandingV1(version='2018-03-16',
-                                                         url=settings.IBM_NLU_URL,
-                                                         iam_apikey=settings.IBM_NLU_APIKEY)
-
-    def process_and_store(self, article, query=None):
+    def duplicate_reports_many(self, articles, keywords=None):
         """
-        Method to call to process the given article and store the analysis in the db
+        Returns a copy of the reports of the analyzed article each of the given ones
+        is a near duplicate of (setting its duplicate_of), by article id, for the
+        articles with a duplicate covering all the given target keywords.
+        All the articles are looked up with a couple of queries
         """
+        duplicates = Article.find_duplicates(articles)
+        reports = {}
+        for article in articles:
+            article_reports = self._copy_reports(article, duplicates.get(article.id), keywords)
+            if article_reports:
+                reports[article.id] = article_reports
+        return reports
+
+    def _copy_reports(self, article, canonical, keywords):
+        if not canonical:
+            return None
+
+        # the most recent report of the canonical article for each keyword
+        canonical_reports = {}
+        for report in canonical.sentiment_data['reports']:
+            keyword = report['target_keyword'].lower() if report['target_keyword'] else None
+            canonical_reports.setdefault(keyword, report)
+
+        keywords = self._as_keywords(keywords) or [None]
+        if any((kw.lower() if kw else None) not in canonical_reports for kw in keywords):
+            return None
+
+        reports = []
+        created_at = datetime.utcnow().isoformat()
+        for target_kw in keywords:
+            report = dict(canonical_reports[target_kw.lower() if target_kw else None])
+            report['target_keyword'] = target_kw
+            report['created_at'] = created_at
+            reports.append(report)
+
+        log.debug("%s reuses the reports of its duplicate %s" % (article, canonical))
+        for target_kw in keywords:
+            metrics.inc('mkrk_articles_near_duplicate_total', keyword=target_kw or '')
+        article.duplicate_of = canonical
+        return reports
 
-        response = self._analyze(article, query=query)
-        if response:
-            self._parse_and_store_response(response, article=article, target_kw=query)
-
-    def _analyze(self, article, query=None):
-        if article.url:
-            params = {'url': article.url}
-        else:
-            return
-
-        sentiment_params = {'document': True}
-        if query:
-            sentiment_params['targets'] = [query]
+    @staticmethod
+    def _as_keywords(keywords):
+        if not keywords:
+            return []
+        if isinstance(keywords, str):
+            return [keywords]
+        return sorted(set(keywords))
+
+    def analyze_many(self, articles, keywords=None):
+        """
+        Returns the analysis of each of the given articles (None if it failed)
+        """
+        return [self._analyze(article, keywords=keywords) for article in articles]
 
-        params['features'] = Features(keywords=KeywordsOptions(sentiment=True,
-                                                               emotion=False,
-                                                               limit=5),
-                                      sentiment=SentimentOptions(**sentiment_params))
+    def stats(self):
+        return {}
 
-        try:
-            response = self.api_client.analyze(**params).get_result()
-        except WatsonApiException as ex:
-            log.error("Method failed with status code " +
-                      str(ex.code) + ": " + ex.message)
-        except Exception as e:
-            log.error(e)
-        else:
-            # print(json.dumps(response, indent=2))
-            return response
+    @abstractmethod
+    def _analyze(self, article, keywords=None):
+        """
+        Returns the analysis of the given article, in the format of the IBM NLU
+        responses
+        """
 
     @staticmethod
-    def _parse_and_store_response(response, article, target_kw):
+    def _parse_response(response, target_kws):
         """
+        Returns the reports of the given analysis, one for each target keyword.
         Documentation for the response:
         https://cloud.ibm.com/apidocs/natural-language-understanding?language=python#keywords
         Example of a response:
@@ -226,9 +421,10 @@ class NewsNLUAnalyzer(object):
         except Exception as e:
             log.error('%s %s' % (e, response))
 
+        target_scores = {}
         try:
-            sentiment_data['target_keyword_score'] = float(response['sentiment']
-                                                           ['targets'][0]['score'])
+            for target in response['sentiment']['targets']:
+                target_scores[target['text'].lower()] = float(target['score'])
         except KeyError:
             pass
         except Exception as e:
@@ -245,14 +441,143 @@ class NewsNLUAnalyzer(object):
         else:
             sentiment_data['article_keywords_scores'] = keyword_scores
 
-        if sentiment_data:
-            sentiment_data['target_keyword'] = target_kw
-            sentiment_data['created_at'] = datetime.utcnow().isoformat()
+        if not sentiment_data and not target_scores:
+            return
+
+        # one report for each target keyword, all sharing the document analysis
+        reports = []
+        created_at = datetime.utcnow().isoformat()
+        for target_kw in BaseAnalyzer._as_keywords(target_kws) or [None]:
+            report = dict(sentiment_data)
+            if target_kw and target_kw.lower() in target_scores:
+                report['target_keyword_score'] = target_scores[target_kw.lower()]
+            report['target_keyword'] = target_kw
+            report['created_at'] = created_at
+            reports.append(report)
+        return reports
+
+    @staticmethod
+    def store_many(analyses):
+        """
+        Stores the given (article, reports) analyses with the same few statements
+        whatever their number
+        """
+        if not analyses:
+            return
+
+        # the reports are inserted in front of any preexisting one to keep the most recent at top
+        Article.update_analyses(analyses)
+        # pushed live to the dashboards of the keywords
+        notify_reports(SentimentReport.store_many(analyses))
+
+        now = timezone.now()
+        for article, reports in analyses:
+            for report in reports:
+                metrics.inc('mkrk_articles_analyzed_total', keyword=report['target_keyword'] or '')
+            published_at = article.published_at
+            if timezone.is_naive(published_at):
+                published_at = timezone.make_aware(published_at, timezone.utc)
+            metrics.observe('mkrk_analysis_lag_seconds', max((now - published_at).total_seconds(), 0),
+                            buckets=LAG_BUCKETS)
+
+
+class NewsNLUAnalyzer(BaseAnalyzer):
+    """
+    IBM Natural Language Understanding analayzer class
+    Check the documentation at
+    https://cloud.ibm.com/apidocs/natural-language-understanding
+    for all the features and parameters available
+    """
+
+    remote = True
+
+    def __init__(self):
+        self.cache = NLUResponseCache()
+        self.rate_limiter = RateLimiter('nlu')
+        self.circuit_breaker = CircuitBreaker('nlu')
+
+    @locked_cached_property
+    def api_client(self):
+        """
+        NLU client, built on first use and then reused by all the calls
+        """
+        from watson_developer_cloud import NaturalLanguageUnderstandingV1, watson_service
+
+        use_pooled_session(watson_service)
+        return NaturalLanguageUnderstandingV1(version='2018-03-16',
+                                              url=settings.IBM_NLU_URL,
+                                              iam_apikey=settings.IBM_NLU_APIKEY)
+
+    def stats(self):
+        return self.cache.stats()
+
+    def _analyze(self, article, keywords=None):
+        from watson_developer_cloud import WatsonApiException
+        from watson_developer_cloud.natural_language_understanding_v1 import Features
+        from watson_developer_cloud.natural_language_understanding_v1 import KeywordsOptions
+        from watson_developer_cloud.natural_language_understanding_v1 import SentimentOptions
+
+        if article.url:
+            params = {'url': article.url}
+        else:
+            return
+
+        keywords = self._as_keywords(keywords)
+        response = self.cache.get(article.url, keywords)
+        if response is not None:
+            return response
+
+        sentiment_params = {'document': True}
+        if keywords:
+            sentiment_params['targets'] = keywords
+
+        params['features'] = Features(keywords=KeywordsOptions(sentiment=True,
+                                                               emotion=False,
+                                                               limit=5),
+                                      sentiment=SentimentOptions(**sentiment_params))
+
+        start_call(self.circuit_breaker, self.rate_limiter)
+        try:
+            with metrics.timer('mkrk_api_call_seconds', api='nlu'):
+                response = self.api_client.analyze(**params).get_result()
+        except WatsonApiException as ex:
+            metrics.inc('mkrk_api_errors_total', api='nlu')
+            log.error("Method failed with status code " +
+                      str(ex.code) + ": " + ex.message)
+            # the articles which can't be analyzed (e.g. unsupported language) are dropped
+            if ex.code and 400 <= ex.code < 500 and ex.code != 429:
+                self.circuit_breaker.record_success()
+                return
+            self.circuit_breaker.record_failure()
+            raise ServiceFailure('nlu', ex)
+        except Exception as e:
+            metrics.inc('mkrk_api_errors_total', api='nlu')
+            log.error(e)
+            self.circuit_breaker.record_failure()
+            raise ServiceFailure('nlu', e)
+        else:
+            self.circuit_breaker.record_success()
+            # print(json.dumps(response, indent=2))
+            self.cache.set(article.url, keywords, response)
+            return response
+
+
+class LocalSentimentAnalyzer(BaseAnalyzer):
+    """
+    In-process analyzer scoring the title and snippet of the articles with the
+    lexicon of SentimentEngine, with no network calls. The articles given
+    together to analyze_many are scored as a single batch
+    """
+
+    @locked_cached_property
+    def engine(self):
+        from main.sentiment import SentimentEngine
+
+        return SentimentEngine()
 
-            if article.sentiment_data:
-                # insert in this report in front of any preexisting one to keep the most recent at top
-                article.sentiment_data['reports'] = [sentiment_data] + article.sentiment_data['reports']
-            else:
-                article.sentiment_data = {'reports': [sentiment_data]}
+    def analyze_many(self, articles, keywords=None):
+        texts = ['%s\n%s' % (article.title or '', article.snippet or '') for article in articles]
+        return self.engine.analyze(texts, targets=self._as_keywords(keywords))
 
-            article.save()
+    def _analyze(self, article, keywords=None):
+        return self.analyze_many([article], keywords=keywords)[0]
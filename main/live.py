@@ -0,0 +1,202 @@
+"""
+Live push of the analyzed articles to the news dashboards. The reports stored
+are notified on a Postgres channel (delivered on commit), a single thread of
+each web process LISTENs to it and fans the events out to the server-sent
+events streams of the users whose keywords match. A waiting stream holds no
+db connection and runs no query
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateformat import format as format_date
+
+from main.models import SentimentReport
+
+log = logging.getLogger(__name__)
+
+CHANNEL = 'mkrk_reports'
+# NOTIFY payloads are limited to 8000 bytes
+MAX_TITLE_LENGTH = 300
+
+
+def report_event(article, reports):
+    """
+    Compact event of the given reports of an article, identified by the time
+    (in microseconds since the epoch, increasing also for the reports updated)
+    and the id of its latest report
+    """
+    latest = max(reports, key=lambda report: (report.created_at, report.id))
+    since_epoch = latest.created_at - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return {'id': [since_epoch // timedelta(microseconds=1), latest.id],
+            'url': article.url,
+            'title': article.title[:MAX_TITLE_LENGTH],
+            'source': article.source,
+            'published_at': format_date(article.published_at, 'm/d/Y fa'),
+            'global_score': reports[0].global_score,
+            'targets': [[report.target_keyword_id, report.target_keyword.keyword,
+                         report.target_keyword_score] for report in reports]}
+
+
+def notify_reports(analyses):
+    """
+    Notifies the listening web processes of the given (article, reports) just
+    stored, with a single statement
+    """
+    payloads = [json.dumps(report_event(article, reports)) for article, reports in analyses if reports]
+    if not payloads:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s) AS payload', [CHANNEL, payloads])
+
+
+def parse_event_id(value):
+    """
+    Returns the event id sent back by a reconnecting browser, None if invalid
+    """
+    try:
+        created_at, report_id = value.split('.')
+        return [int(created_at), int(report_id)]
+    except (AttributeError, ValueError):
+        return None
+
+
+def missed_events(target_ids, last_event_id):
+    """
+    Events of the reports stored after the given event id, for a client reconnecting
+    """
+    created_at, report_id = last_event_id
+    since = datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=created_at)
+    reports = SentimentReport.objects.filter(Q(created_at__gt=since) | Q(created_at=since, id__gt=report_id),
+                                             target_keyword__in=target_ids)\
+        .select_related('article', 'target_keyword')\
+        .order_by('created_at', 'id')[:settings.LIVE_MAX_MISSED_EVENTS]
+    by_article = {}
+    for report in reports:
+        by_article.setdefault(report.article_id, []).append(report)
+    return [report_event(article_reports[0].article, article_reports)
+            for article_reports in by_article.values()]
+
+
+class ReportListener(object):
+    """
+    LISTENs to the reports notified on its own connection, started by the first
+    subscriber, and puts the events in the queues of the subscribers to their keywords
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, target_ids):
+        events = queue.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[events] = set(target_ids)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='report-listener', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._subscribers.pop(events, None)
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                log.error('report listener failed: %s' % e)
+            time.sleep(settings.LIVE_RECONNECT_DELAY)
+
+    def _listen(self):
+        listen_connection = psycopg2.connect(**connections['default'].get_connection_params())
+        try:
+            listen_connection.autocommit = True
+            with listen_connection.cursor() as cursor:
+                cursor.execute('LISTEN %s' % CHANNEL)
+            while True:
+                if select.select([listen_connection], [], [], 60) == ([], [], []):
+                    continue
+                listen_connection.poll()
+                while listen_connection.notifies:
+                    self._dispatch(json.loads(listen_connection.notifies.pop(0).payload))
+        finally:
+            listen_connection.close()
+
+    def _dispatch(self, event):
+        target_ids = {target[0] for target in event['targets']}
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for events, subscribed in subscribers:
+            if target_ids & subscribed:
+                try:
+                    events.put_nowait(event)
+                except queue.Full:
+                    # a stalled client loses the events, reloading the page recovers them
+                    pass
+
+
+listener = ReportListener()
+
+# stream slots of this process, each stream holds a worker thread
+_stream_slots = threading.BoundedSemaphore(settings.LIVE_MAX_STREAMS)
+
+
+def _format_event(event, target_ids):
+    event = dict(event, targets=[target for target in event['targets'] if target[0] in target_ids])
+    return 'id: %d.%d\nevent: report\ndata: %s\n\n' % (event['id'][0], event['id'][1], json.dumps(event))
+
+
+def stream_events(target_ids, last_event_id=None):
+    """
+    Server-sent events of the reports of the given keywords, starting after
+    last_event_id if given, with a comment sent every LIVE_KEEPALIVE seconds
+    of silence to keep the connection open.
+    The stream ends after LIVE_MAX_STREAM_SECONDS, or right away if this process
+    already has LIVE_MAX_STREAMS open, and the browser reconnects with the id of
+    the last event received, so the threads are never all taken by idle streams
+    """
+    if not _stream_slots.acquire(blocking=False):
+        # retry later, hopefully on a less busy process
+        yield 'retry: %d\n\n' % (settings.LIVE_RECONNECT_DELAY * 2000)
+        return
+
+    target_ids = set(target_ids)
+    # subscribed before reading the missed events so that none is lost in between
+    events = listener.subscribe(target_ids)
+    try:
+        deadline = time.monotonic() + settings.LIVE_MAX_STREAM_SECONDS
+        yield 'retry: %d\n\n' % (settings.LIVE_RECONNECT_DELAY * 1000)
+        if last_event_id:
+            for event in missed_events(target_ids, last_event_id):
+                last_event_id = max(last_event_id, event['id'])
+                yield _format_event(event, target_ids)
+        # nothing else is read from the db while waiting
+        connection.close()
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = events.get(timeout=min(settings.LIVE_KEEPALIVE, remaining))
+            except queue.Empty:
+                if time.monotonic() < deadline:
+                    yield ': keepalive\n\n'
+            else:
+                if not last_event_id or event['id'] > last_event_id:
+                    yield _format_event(event, target_ids)
+    finally:
+        listener.unsubscribe(events)
+        _stream_slots.release()
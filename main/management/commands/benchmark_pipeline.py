@@ -0,0 +1,171 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from main.cache import NLUResponseCache
+from main.circuit import ServiceUnavailable
+from main.fakes import FakeNLUClient, FakeNewsApiClient, NoCircuitBreaker, NoRateLimit, RecordingClient
+from main.fetchers import LocalSentimentAnalyzer, NewsAPIScraper, NewsNLUAnalyzer
+from main.models import Article, NLUCacheEntry, Target
+from main.pipeline import analyze_batch
+
+
+class QueryCounter(object):
+    """
+    Execute wrapper counting the queries run by all the db connections
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+class Command(BaseCommand):
+    help = 'Runs scrape -> store -> analyze for generated keywords against the fake ' \
+           'NewsAPI and NLU clients and reports the throughput, the latency ' \
+           'percentiles and the db queries of each stage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keywords', type=int, default=10,
+                            help='number of target keywords')
+        parser.add_argument('--articles', type=int, default=100,
+                            help='number of articles scraped for each keyword')
+        parser.add_argument('--recording', default=None,
+                            help='JSON lines file of the API responses to replay')
+        parser.add_argument('--record', default=None,
+                            help='call the real APIs, appending their responses to this '
+                                 'JSON lines file to be replayed by --recording')
+        parser.add_argument('--latency', type=float, default=50,
+                            help='average latency of the fake API calls in ms')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='fraction of the fake API calls failing')
+        parser.add_argument('--analyzer', choices=['nlu', 'local'], default='nlu')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='NLU requests in flight (NLU_CONCURRENCY by default)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='articles analyzed together (ANALYSIS_CHUNK_SIZE by default)')
+        parser.add_argument('--keep', action='store_true',
+                            help="don't delete the keywords and articles created")
+
+    def handle(self, *args, **options):
+        fake_options = {'recording': options['recording'], 'latency': options['latency'] / 1000.0,
+                        'error_rate': options['error_rate']}
+
+        scraper = NewsAPIScraper()
+        analyzer = NewsNLUAnalyzer() if options['analyzer'] == 'nlu' else LocalSentimentAnalyzer()
+        if options['record']:
+            scraper.api_client = RecordingClient(scraper.api_client, 'newsapi', options['record'])
+            if options['analyzer'] == 'nlu':
+                analyzer.api_client = RecordingClient(analyzer.api_client, 'nlu', options['record'])
+        else:
+            scraper.api_client = FakeNewsApiClient(articles_per_call=options['articles'], **fake_options)
+            # the failures of the fakes don't open the circuits of the real APIs
+            scraper.rate_limiter, scraper.circuit_breaker = NoRateLimit(), NoCircuitBreaker()
+            if options['analyzer'] == 'nlu':
+                analyzer.api_client = FakeNLUClient(**fake_options)
+                analyzer.rate_limiter, analyzer.circuit_breaker = NoRateLimit(), NoCircuitBreaker()
+
+        # far in the future, so the scheduler leaves them alone
+        run = timezone.now().strftime('%Y%m%d%H%M%S')
+        targets = Target.objects.bulk_create([
+            Target(keyword='bench%s-%d' % (run, index), expired_at=timezone.now() + timedelta(days=365))
+            for index in range(options['keywords'])])
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        for connection in connections.all():
+            counter.install(connection)
+
+        chunk_size = options['chunk_size'] or settings.ANALYSIS_CHUNK_SIZE
+        stages = {'scrape+store': [], 'analyze': []}
+        queries = {'scrape+store': 0, 'analyze': 0}
+        stored = analyzed = failed = 0
+        # keyword scraping each article
+        uids = {}
+        started = time.perf_counter()
+        try:
+            for target in targets:
+                stage_started, stage_queries = time.perf_counter(), counter.count
+                try:
+                    new_uids = scraper.fetch_and_store(query=target.keyword)
+                except ServiceUnavailable:
+                    # retried later by the scraping task
+                    new_uids = []
+                    failed += 1
+                stages['scrape+store'].append(time.perf_counter() - stage_started)
+                queries['scrape+store'] += counter.count - stage_queries
+                stored += len(new_uids)
+                uids.update(dict.fromkeys(new_uids, target.keyword))
+
+                # in chunks, as submitted by the scraping tasks
+                stage_started, stage_queries = time.perf_counter(), counter.count
+                new_uids = sorted(new_uids)
+                for start in range(0, len(new_uids), chunk_size):
+                    try:
+                        analyzed += analyze_batch(analyzer, new_uids[start:start + chunk_size], target.keyword,
+                                                  concurrency=options['concurrency'])
+                    except ServiceUnavailable as e:
+                        # retried later by the analysis task
+                        analyzed += min(chunk_size, len(new_uids) - start) - len(e.article_uids)
+                        failed += len(e.article_uids)
+                stages['analyze'].append(time.perf_counter() - stage_started)
+                queries['analyze'] += counter.count - stage_queries
+        finally:
+            elapsed = time.perf_counter() - started
+            connection_created.disconnect(counter.install)
+            for connection in connections.all():
+                if counter in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(counter)
+
+            if not options['keep']:
+                self._cleanup(targets, uids)
+
+        self.stdout.write('%d keywords, %d articles stored, %d analyzed in %.2f s: %.1f articles/s'
+                          % (len(targets), stored, analyzed, elapsed, analyzed / elapsed if elapsed else 0))
+        if failed:
+            self.stdout.write('%d failed calls left to the retries' % failed)
+        self.stdout.write('%-14s %9s %9s %9s %10s' % ('stage', 'p50 ms', 'p99 ms', 'total s', 'queries'))
+        for stage, latencies in stages.items():
+            self.stdout.write('%-14s %9.1f %9.1f %9.2f %10d' % (
+                stage, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                sum(latencies), queries[stage]))
+
+        clients = [('newsapi', scraper.api_client), ('nlu', getattr(analyzer, 'api_client', None))]
+        for name, client in clients:
+            if not hasattr(client, 'call_latencies'):
+                continue
+            latencies = client.call_latencies
+            self.stdout.write('%-14s %9.1f %9.1f %9s %10s  %d calls' % (
+                name + ' calls', percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                '', '', len(latencies)))
+        self.stdout.write('queries per article stored: %.1f' % (sum(queries.values()) / float(stored or 1)))
+
+    @staticmethod
+    def _cleanup(targets, uids):
+        articles = Article.objects.filter(uid__in=list(uids))
+        keys = [NLUResponseCache.get_key(url, [uids[uid]]) for uid, url in articles.values_list('uid', 'url')]
+        NLUCacheEntry.objects.filter(key__in=keys).delete()
+        articles.delete()
+        Target.objects.filter(id__in=[target.id for target in targets]).delete()
@@ -0,0 +1,126 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import force_authenticate
+
+from main import api, views
+from main.management.commands.generate_corpus import CORPUS_USER
+from main.models import Article, SentimentReport
+
+
+class Command(BaseCommand):
+    help = 'Times the read paths for a user of the generated corpus, counting their ' \
+           'queries and peak memory, and saves the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default=CORPUS_USER + '0',
+                            help='username whose dashboards are read')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of warm runs of each read path')
+        parser.add_argument('--output', default=None,
+                            help='JSON file where the results are saved')
+        parser.add_argument('--compare', default=None,
+                            help='JSON file of previous results to compare with')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('unknown user %s, see generate_corpus' % options['user'])
+
+        # the requests are built by hand: they must come from an allowed host
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        factory = RequestFactory(HTTP_HOST=host)
+        reports = SentimentReport.objects.filter(target_keyword__in=user.my_targets.values('target_keyword'))
+
+        def view(func, path, authenticate=False, **params):
+            def read():
+                request = factory.get(path, params)
+                request.user = user
+                if authenticate:
+                    force_authenticate(request, user=user)
+                response = func(request)
+                if hasattr(response, 'render'):
+                    response.render()
+                return response.status_code
+            return read
+
+        paths = [
+            ('news_page', view(views.news_page, '/dashboard/news')),
+            ('trends_page', view(views.trends_page, '/dashboard/trends')),
+            ('api_article', view(api.APIArticle.as_view(), '/api/v1/article', True)),
+            ('api_article_compact', view(api.APIArticle.as_view(), '/api/v1/article', True, compact=1)),
+            ('api_article_fields', view(api.APIArticle.as_view(), '/api/v1/article', True,
+                                        fields='title,url,published_at')),
+            ('api_article_search', view(api.APIArticleSearch.as_view(), '/api/v1/article/search', True,
+                                        q='investors growth', compact=1)),
+            ('get_score_data', lambda: len(Article.get_score_data(reports))),
+            ('get_score_averages', lambda: len(Article.get_score_averages(reports))),
+        ]
+
+        results = {}
+        for name, read in paths:
+            # cold runs, with the dashboards cache empty: timed, then traced
+            # separately since tracing the allocations slows them down
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                read()
+                cold = time.perf_counter() - started
+
+            cache.clear()
+            tracemalloc.start()
+            read()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            warm = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                read()
+                warm.append(time.perf_counter() - started)
+
+            results[name] = {'cold_ms': round(cold * 1000, 3),
+                             'warm_p50_ms': round(statistics.median(warm) * 1000, 3) if warm else None,
+                             'warm_max_ms': round(max(warm) * 1000, 3) if warm else None,
+                             'queries': len(queries),
+                             'peak_memory_kb': round(peak / 1024.0, 1)}
+
+        output = {'created_at': timezone.now().isoformat(),
+                  'corpus': {'articles': Article.objects.count(),
+                             'reports': SentimentReport.objects.count(),
+                             'user_reports': reports.count()},
+                  'results': results}
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = json.load(previous)['results']
+
+        self.stdout.write('%d articles, %d reports, %d reports for %s' % (
+            output['corpus']['articles'], output['corpus']['reports'],
+            output['corpus']['user_reports'], user.username))
+        self.stdout.write('%-20s %10s %10s %8s %10s %8s' % ('path', 'cold ms', 'warm ms', 'queries',
+                                                            'peak KB', 'vs base'))
+        for name, result in results.items():
+            change = ''
+            if name in baseline and baseline[name]['cold_ms']:
+                change = '%+.0f%%' % ((result['cold_ms'] / baseline[name]['cold_ms'] - 1) * 100)
+            self.stdout.write('%-20s %10.1f %10.1f %8d %10.1f %8s' % (
+                name, result['cold_ms'], result['warm_p50_ms'] or 0, result['queries'],
+                result['peak_memory_kb'], change))
+
+        if options['output']:
+            with open(options['output'], 'w') as saved:
+                json.dump(output, saved, indent=2)
+            self.stdout.write('results saved to %s' % options['output'])
@@ -0,0 +1,66 @@
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.utils import resample_timeseries
+
+
+def pandas_resample_timeseries(data):
+    """
+    The former pandas implementation of resample_timeseries, used as reference
+    """
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(data, columns=['date', 'score'])
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.set_index('date')
+    d2 = df.resample('D').mean()
+    d2 = d2.fillna(0)
+    d2['date'] = d2.index.to_series()
+    d2['date'] = pd.to_datetime(d2['date'])
+    d2['date'] = d2['date'].dt.strftime('%Y-%m-%d')
+    d2 = d2.set_index('date')
+    return list(d2.itertuples(name=None))
+
+
+class Command(BaseCommand):
+    help = 'Compares the output and the speed of resample_timeseries with the ' \
+           'former pandas implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=100,
+                            help='number of data points of each series')
+        parser.add_argument('--days', type=int, default=30,
+                            help='number of days spanned by each series')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            raise CommandError('pandas is needed to run the reference implementation')
+
+        random.seed(0)
+        start = timezone.now() - timedelta(days=options['days'])
+        data = [(start + timedelta(seconds=random.randint(0, options['days'] * 86400)),
+                 round(random.uniform(-1, 1), 6))
+                for _ in range(options['points'])]
+        # sparse series, with gaps to zero-fill
+        sparse = [(datetime(2018, 12, 1, 10), 0.5), (datetime(2018, 12, 5, 23, 59), -0.25),
+                  (datetime(2018, 12, 5, 0, 0), 0.75)]
+
+        for series in (data, sparse):
+            expected = pandas_resample_timeseries(series)
+            result = resample_timeseries(series)
+            # the averages only differ by floating point rounding of the sums
+            if [d for d, _ in expected] != [d for d, _ in result] or \
+                    any(abs(e - r) > 1e-12 for (_, e), (_, r) in zip(expected, result)):
+                raise CommandError('output mismatch:\n%s\n%s' % (expected, result))
+
+        for name, func in (('pandas', pandas_resample_timeseries),
+                           ('python', resample_timeseries)):
+            elapsed = timeit.timeit(lambda: func(data), number=options['repeat'])
+            self.stdout.write('%-8s %8.3f ms per series' % (name, elapsed * 1000 / options['repeat']))
@@ -0,0 +1,67 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# packages slow to import, which only the processes calling the APIs should load
+HEAVY_PACKAGES = ('watson_developer_cloud', 'newsapi', 'numpy', 'pandas')
+
+# run in a fresh interpreter for each measure: the prepare code is not timed
+CHILD_SCRIPT = '''
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mkrk.settings')
+%s
+before = set(sys.modules)
+started = time.perf_counter()
+%s
+elapsed = time.perf_counter() - started
+loaded = set(sys.modules) - before
+print(json.dumps({'seconds': elapsed, 'modules': len(loaded),
+                  'heavy': sorted(name for name in loaded if name in %r)}))
+'''
+
+SETUP = 'import django\ndjango.setup()'
+
+# name, prepare code, timed code
+STARTUP_PATHS = [
+    ('mkrk.settings', '', 'import mkrk.settings'),
+    ('django.setup', '', SETUP),
+    ('main.tasks', SETUP, 'import main.tasks'),
+    ('main.views', SETUP, 'import main.views'),
+    ('api clients', SETUP + '\nfrom main import tasks',
+     'tasks.news_scraper.api_client\n'
+     'for attr in ("api_client", "engine"):\n'
+     '    getattr(tasks.news_analyzer, attr, None)'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Times the import of the settings, the tasks and the views modules (as done by ' \
+           'the start of the web and celery processes) and the first use of the API clients, ' \
+           'each in a fresh interpreter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of fresh interpreters timed for each import')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-16s %10s %10s %8s  %s' % ('import', 'p50 ms', 'max ms', 'modules', 'heavy packages'))
+        for name, prepare, timed in STARTUP_PATHS:
+            runs = [self._run(prepare, timed) for _ in range(max(options['repeat'], 1))]
+            seconds = [run['seconds'] for run in runs]
+            self.stdout.write('%-16s %10.1f %10.1f %8d  %s' % (
+                name, statistics.median(seconds) * 1000, max(seconds) * 1000, runs[0]['modules'],
+                ', '.join(runs[0]['heavy']) or '-'))
+
+    @staticmethod
+    def _run(prepare, timed):
+        script = CHILD_SCRIPT % (prepare, timed, HEAVY_PACKAGES)
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from main.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Trims the report history stored in the sentiment_data of the articles to the ' \
+           'latest reports of each target keyword'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.SENTIMENT_REPORTS_PER_KEYWORD,
+                            help='reports kept for each target keyword of an article')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='range of article ids compacted by each statement')
+
+    def handle(self, *args, **options):
+        if options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        # short statements on consecutive id ranges, not to lock the whole table at once
+        ids = Article.objects.aggregate(first=Min('id'), last=Max('id'))
+        count = 0
+        if ids['first'] is not None:
+            for start in range(ids['first'], ids['last'] + 1, options['batch_size']):
+                count += Article.compact_reports(options['keep'], start, start + options['batch_size'])
+
+        self.stdout.write('compacted the reports of %d articles, keeping %d per keyword'
+                          % (count, options['keep']))
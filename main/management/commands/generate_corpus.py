@@ -0,0 +1,140 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Article, SentimentReport, Target, UserTarget
+
+CORPUS_URL = 'https://corpus.example.com/'
+CORPUS_USER = 'corpus_user'
+CORPUS_KEYWORD = 'corpus'
+
+SOURCES = ['CNN', 'BBC News', 'Business Insider', 'Ars Technica', 'TechCrunch']
+COMPANIES = ['Apple', 'Google', 'Amazon', 'Microsoft', 'Tesla', 'Facebook', 'Netflix', 'Intel',
+             'Samsung', 'Uber', 'Twitter', 'Nvidia', 'Oracle', 'IBM', 'Spotify', 'Airbnb']
+VERBS = ['launches', 'cuts', 'beats', 'misses', 'unveils', 'acquires', 'sues', 'recalls',
+         'expands', 'delays', 'upgrades', 'warns about']
+NOUNS = ['earnings', 'profits', 'new phone', 'cloud business', 'ad revenue', 'data center',
+         'self-driving cars', 'streaming service', 'chip supply', 'privacy policy', 'layoffs']
+WORDS = ['market', 'investors', 'growth', 'quarter', 'users', 'analysts', 'shares', 'deal',
+         'regulators', 'lawsuit', 'revenue', 'launch', 'outage', 'forecast', 'strategy']
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic corpus of articles with long sentiment report ' \
+           'histories, target keywords and users to benchmark the read paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000)
+        parser.add_argument('--keywords', type=int, default=50)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--keywords-per-user', type=int, default=5)
+        parser.add_argument('--reports', type=int, default=10,
+                            help='maximum number of reports in the history of an article')
+        parser.add_argument('--days', type=int, default=365,
+                            help='days spanned by the publication dates')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--delete', action='store_true',
+                            help='delete the corpus previously generated instead')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            self.delete(options['batch_size'])
+            return
+
+        if User.objects.filter(username__startswith=CORPUS_USER).exists():
+            raise CommandError('a corpus has been generated already, delete it first with --delete')
+
+        rand = random.Random(options['seed'])
+        now = timezone.now()
+        keywords = ['%s %s%d' % (COMPANIES[n % len(COMPANIES)], CORPUS_KEYWORD, n)
+                    for n in range(options['keywords'])]
+
+        # bulk created, so no historic scrape is submitted, and never expired
+        targets = Target.objects.bulk_create([Target(keyword=keyword, expired_at=now + timedelta(days=3650))
+                                              for keyword in keywords])
+        users = [User.objects.create_user('%s%d' % (CORPUS_USER, n), password=CORPUS_USER)
+                 for n in range(options['users'])]
+        UserTarget.objects.bulk_create([UserTarget(user=user, target_keyword=target)
+                                        for user in users
+                                        for target in rand.sample(targets, min(options['keywords_per_user'],
+                                                                               len(targets)))])
+
+        count = reports_count = 0
+        while count < options['articles']:
+            size = min(options['batch_size'], options['articles'] - count)
+            with transaction.atomic():
+                articles, article_targets = [], []
+                for n in range(count, count + size):
+                    article_target = rand.sample(targets, rand.randint(1, min(3, len(targets))))
+                    articles.append(self._article(rand, n, now, options, article_target))
+                    article_targets.append(article_target)
+                Article.objects.bulk_create(articles)
+                Article.objects.filter(id__in=[article.id for article in articles])\
+                    .update(search_vector=Article.search_vector_expression())
+
+                reports = []
+                for article, article_target in zip(articles, article_targets):
+                    # one row for the latest report of each keyword of the article
+                    latest = {}
+                    for report in article.sentiment_data['reports']:
+                        latest.setdefault(report['target_keyword'], report)
+                    for target in article_target:
+                        report = latest[target.keyword]
+                        reports.append(SentimentReport(article=article, target_keyword=target,
+                                                       target_keyword_score=report['target_keyword_score'],
+                                                       global_score=report['global_score'],
+                                                       published_at=article.published_at,
+                                                       created_at=now))
+                SentimentReport.objects.bulk_create(reports)
+            count += size
+            reports_count += len(reports)
+            self.stdout.write('%d articles, %d reports' % (count, reports_count))
+
+        Target.objects.filter(id__in=[target.id for target in targets]).update(reports_updated_at=now)
+        call_command('rebuild_daily_sentiment', stdout=self.stdout)
+
+    @staticmethod
+    def _article(rand, n, now, options, targets):
+        company = targets[0].keyword
+        title = '%s %s %s' % (company, rand.choice(VERBS), rand.choice(NOUNS))
+        snippet = ' '.join(rand.choice(WORDS) for _ in range(30)) + ' [+%d chars]' % rand.randint(500, 5000)
+        published_at = now - timedelta(seconds=rand.randint(0, options['days'] * 86400))
+
+        # history of analyses, the most recent first, cycling over the keywords
+        history = rand.randint(len(targets), max(options['reports'], len(targets)))
+        created_at = published_at
+        reports = []
+        for index in range(history):
+            created_at += timedelta(minutes=rand.randint(1, 600))
+            reports.append({'created_at': created_at.replace(tzinfo=None).isoformat(),
+                            'target_keyword': targets[index % len(targets)].keyword,
+                            'target_keyword_score': round(rand.uniform(-1, 1), 6),
+                            'global_score': round(rand.uniform(-1, 1), 6),
+                            'article_keywords_scores': [(word, round(rand.uniform(-1, 1), 6))
+                                                        for word in rand.sample(WORDS, 5)]})
+        reports.reverse()
+
+        return Article(url='%s%d/%s' % (CORPUS_URL, n, title.lower().replace(' ', '-')),
+                       title=title, snippet=snippet, source=rand.choice(SOURCES),
+                       published_at=published_at, sentiment_data={'reports': reports})
+
+    def delete(self, batch_size):
+        articles = Article.objects.filter(url__startswith=CORPUS_URL)
+        count = 0
+        while True:
+            ids = list(articles.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            Article.objects.filter(id__in=ids).delete()
+            count += len(ids)
+        # the keywords left without users are deleted along with the users
+        User.objects.filter(username__startswith=CORPUS_USER).delete()
+        Target.objects.filter(keyword__contains=' %s' % CORPUS_KEYWORD).delete()
+        self.stdout.write('deleted %d articles' % count)
+        call_command('rebuild_daily_sentiment', stdout=self.stdout)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+from main.models import DailySentiment, SentimentReport
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds from scratch the daily sentiment rollups of the reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rollups = SentimentReport.objects.exclude(target_keyword_score=None)\
+            .annotate(day=TruncDate('published_at'))\
+            .order_by()\
+            .values('target_keyword', 'day')\
+            .annotate(score_sum=Sum('target_keyword_score'),
+                      score_count=Count('id'),
+                      score_min=Min('target_keyword_score'),
+                      score_max=Max('target_keyword_score'))
+
+        count = 0
+        with transaction.atomic():
+            DailySentiment.objects.all().delete()
+
+            batch = []
+            for rollup in rollups.iterator():
+                batch.append(DailySentiment(target_keyword_id=rollup['target_keyword'],
+                                            day=rollup['day'],
+                                            score_sum=rollup['score_sum'],
+                                            score_count=rollup['score_count'],
+                                            score_min=rollup['score_min'],
+                                            score_max=rollup['score_max']))
+                if len(batch) >= options['batch_size']:
+                    DailySentiment.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+
+            DailySentiment.objects.bulk_create(batch)
+            count += len(batch)
+
+        self.stdout.write('rebuilt %d daily sentiment rollups' % count)
@@ -0,0 +1,78 @@
+from collections import deque
+
+
+class KeywordMatcher(object):
+    """
+    Aho-Corasick automaton matching a set of target keywords against a text
+    in a single pass, so the cost of tagging an article does not depend on
+    the number of keywords.
+    Matching is case insensitive and only whole words are reported
+    (e.g. 'apple' does not match 'pineapple')
+    """
+
+    def __init__(self, keywords):
+        # the automaton states: transitions, failure link and matched keywords
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword):
+        pattern = keyword.strip().lower()
+        if not pattern:
+            return
+
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].add((keyword, len(pattern)))
+
+    def _build(self):
+        """
+        Computes the failure links with a breadth-first visit of the trie
+        """
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def match(self, *texts):
+        """
+        Returns the set of keywords found in any of the given texts
+        """
+        found = set()
+        for text in texts:
+            if not text:
+                continue
+            text = text.lower()
+            state = 0
+            for end, char in enumerate(text):
+                while state and char not in self._goto[state]:
+                    state = self._fail[state]
+                state = self._goto[state].get(char, 0)
+                for keyword, length in self._output[state]:
+                    start = end - length + 1
+                    if self._is_word_boundary(text, start - 1) and \
+                            self._is_word_boundary(text, end + 1):
+                        found.add(keyword)
+        return found
+
+    @staticmethod
+    def _is_word_boundary(text, index):
+        return index < 0 or index >= len(text) or not text[index].isalnum()
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.db import connection
+
+from main.models import Metric
+
+log = logging.getLogger(__name__)
+
+# upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+LAG_BUCKETS = (60, 300, 900, 3600, 3600 * 4, 3600 * 12, 86400, 86400 * 3, 86400 * 7, 86400 * 30)
+
+# name: (type, help) of the metrics exposed
+METRICS = {
+    'mkrk_api_call_seconds': ('histogram', 'Latency of the NewsAPI and NLU calls'),
+    'mkrk_api_errors_total': ('counter', 'NewsAPI and NLU calls failed'),
+    'mkrk_api_rejected_total': ('counter', 'NewsAPI and NLU calls rejected by their open circuit breaker'),
+    'mkrk_articles_fetched_total': ('counter', 'Articles returned by NewsAPI'),
+    'mkrk_articles_new_total': ('counter', 'Articles fetched and stored for the first time'),
+    'mkrk_articles_duplicate_total': ('counter', 'Articles fetched which were stored already'),
+    'mkrk_articles_near_duplicate_total': ('counter', 'Articles reusing the reports of a near duplicate'),
+    'mkrk_articles_analyzed_total': ('counter', 'Sentiment reports stored'),
+    'mkrk_analysis_lag_seconds': ('histogram', 'Time from the publication of an article to its analysis'),
+    'mkrk_worker_articles_analyzed_total': ('counter', 'Articles analyzed by the batch tasks of each worker'),
+    'mkrk_worker_analysis_seconds_total': ('counter', 'Time spent by each worker running the batch analysis tasks'),
+    'mkrk_task_seconds': ('histogram', 'Duration of the celery tasks'),
+    'mkrk_task_queue_seconds': ('histogram', 'Time spent by the celery tasks in the queue'),
+}
+
+
+def _format_labels(labels, le=None):
+    """
+    Labels in the Prometheus format, sorted by name with the bucket bound last
+    """
+    items = sorted(labels.items())
+    if le is not None:
+        items.append(('le', le))
+    return ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for name, value in items)
+
+
+class MetricsRegistry(object):
+    """
+    Counters and histograms of a process, kept in memory and added to the
+    Metric rows shared by all the processes on flush()
+    """
+
+    def __init__(self):
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._values[(name, _format_labels(labels))] += value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """
+        Adds a value to a histogram: every bucket is kept, even if empty
+        """
+        with self._lock:
+            for bound in buckets:
+                self._values[(name + '_bucket', _format_labels(labels, le=bound))] += int(value <= bound)
+            self._values[(name + '_bucket', _format_labels(labels, le='+Inf'))] += 1
+            self._values[(name + '_sum', _format_labels(labels))] += value
+            self._values[(name + '_count', _format_labels(labels))] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def flush(self):
+        """
+        Adds the values collected since the last flush to the db with a single upsert
+        """
+        with self._lock:
+            values, self._values = self._values, defaultdict(float)
+        if not values:
+            return
+
+        params = []
+        # always in the same order, so concurrent flushes don't deadlock
+        for (name, labels), value in sorted(values.items()):
+            params += [name, labels, value]
+        table = connection.ops.quote_name(Metric._meta.db_table)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('INSERT INTO %s (name, labels, value) VALUES %s '
+                               'ON CONFLICT (name, labels) DO UPDATE SET value = %s.value + EXCLUDED.value'
+                               % (table, ', '.join(['(%s, %s, %s)'] * len(values)), table), params)
+        except Exception as e:
+            log.error('metrics flush failed: %s' % e)
+
+
+metrics = MetricsRegistry()
+
+# start time of the tasks running in this process
+_tasks_started = {}
+
+
+@before_task_publish.connect
+def set_task_sent_at(headers=None, **kwargs):
+    if headers is not None:
+        headers['sent_at'] = time.time()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    now = time.time()
+    _tasks_started[task_id] = now
+    sent_at = getattr(task.request, 'sent_at', None) or (getattr(task.request, 'headers', None) or {}).get('sent_at')
+    if sent_at:
+        metrics.observe('mkrk_task_queue_seconds', max(now - sent_at, 0), buckets=LAG_BUCKETS, task=task.name)
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _tasks_started.pop(task_id, None)
+    if started:
+        metrics.observe('mkrk_task_seconds', time.time() - started, task=task.name, state=state or '')
+    metrics.flush()
+
+
+def render_metrics():
+    """
+    Returns the metrics of all the processes in the Prometheus text format
+    """
+    families = defaultdict(list)
+    for name, labels, value in Metric.objects.values_list('name', 'labels', 'value'):
+        family = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                family = name[:-len(suffix)]
+        families[family].append((name, labels, value))
+
+    def sort_key(sample):
+        # the buckets of each histogram in increasing order of their bound
+        name, labels, _ = sample
+        others, _, bound = labels.rpartition('le="')
+        if name.endswith('_bucket') and bound:
+            bound = bound.rstrip('"')
+            return name, others, float('inf') if bound == '+Inf' else float(bound)
+        return name, labels, 0
+
+    lines = []
+    for family in sorted(families):
+        metric_type, help_text = METRICS.get(family, ('untyped', ''))
+        lines.append('# HELP %s %s' % (family, help_text))
+        lines.append('# TYPE %s %s' % (family, metric_type))
+        for name, labels, value in sorted(families[family], key=sort_key):
+            lines.append('%s%s %s' % (name, '{%s}' % labels if labels else '', repr(float(value))))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,21 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='backfilled_until',
+            field=models.DateField(
+                help_text='oldest day of the historic articles already '
+                          'fetched',
+                null=True),
+        ),
+    ]
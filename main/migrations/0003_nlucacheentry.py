@@ -0,0 +1,27 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:29
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_target_backfilled_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NLUCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('response', django.contrib.postgres.fields.
+                 jsonb.JSONField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True,
+                                                    db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:30
+
+from django.db import migrations, models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import django.db.models.deletion
+
+
+def backfill_sentiment_reports(apps, schema_editor):
+    """
+    Creates the reports of each article from its sentiment_data, keeping
+    the most recent report of each target keyword
+    """
+    Article = apps.get_model('main', 'Article')
+    SentimentReport = apps.get_model('main', 'SentimentReport')
+    Target = apps.get_model('main', 'Target')
+
+    targets_by_keyword = {}
+    for target_id, keyword in Target.objects.values_list('id', 'keyword'):
+        targets_by_keyword.setdefault(keyword, []).append(target_id)
+
+    batch = []
+    articles = Article.objects.exclude(sentiment_data=None).only(
+        'id', 'published_at', 'sentiment_data')
+    for article in articles.iterator():
+        seen = set()
+        for rep in article.sentiment_data.get('reports', []):
+            keyword = rep.get('target_keyword')
+            if keyword in seen:
+                continue
+            seen.add(keyword)
+
+            created_at = parse_datetime(rep.get('created_at') or '')
+            if created_at is None:
+                created_at = timezone.now()
+            elif timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at, timezone.utc)
+
+            for target_id in targets_by_keyword.get(keyword, []):
+                batch.append(SentimentReport(
+                    article_id=article.id, target_keyword_id=target_id,
+                    target_keyword_score=rep.get('target_keyword_score'),
+                    global_score=rep.get('global_score'),
+                    published_at=article.published_at,
+                    created_at=created_at))
+
+        if len(batch) >= 1000:
+            SentimentReport.objects.bulk_create(batch)
+            batch = []
+
+    SentimentReport.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_nlucacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentReport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('target_keyword_score', models.FloatField(null=True)),
+                ('global_score', models.FloatField(null=True)),
+                ('published_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('article', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='reports', to='main.Article')),
+                ('target_keyword', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='reports', to='main.Target')),
+            ],
+            options={
+                'ordering': ('-published_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='sentimentreport',
+            index=models.Index(fields=['target_keyword', '-published_at'],
+                               name='main_sentim_target__dba893_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sentimentreport',
+            unique_together={('article', 'target_keyword')},
+        ),
+        migrations.RunPython(backfill_sentiment_reports,
+                             migrations.RunPython.noop),
+    ]
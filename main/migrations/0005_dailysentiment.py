@@ -0,0 +1,33 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_sentimentreport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySentiment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_count', models.IntegerField(default=0)),
+                ('score_min', models.FloatField(null=True)),
+                ('score_max', models.FloatField(null=True)),
+                ('target_keyword', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='daily_sentiment', to='main.Target')),
+            ],
+            options={
+                'ordering': ('day',),
+                'unique_together': {('target_keyword', 'day')},
+            },
+        ),
+    ]
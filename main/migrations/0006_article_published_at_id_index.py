@@ -0,0 +1,18 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_dailysentiment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['-published_at', '-id'],
+                               name='main_articl_publish_50afbd_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_article_published_at_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='reports_updated_at',
+            field=models.DateTimeField(
+                help_text='time of the last sentiment report stored',
+                null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_target_reports_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIService',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('tokens', models.FloatField(default=0)),
+                ('refilled_at', models.DateTimeField(null=True)),
+                ('granted', models.BigIntegerField(
+                    default=0, help_text='number of calls allowed')),
+                ('throttled', models.BigIntegerField(
+                    default=0,
+                    help_text='number of waits for the rate limit')),
+            ],
+        ),
+    ]
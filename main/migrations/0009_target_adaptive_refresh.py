@@ -0,0 +1,40 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_apiservice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='last_yield',
+            field=models.IntegerField(
+                help_text='number of new articles found by the last refresh',
+                null=True),
+        ),
+        migrations.AddField(
+            model_name='target',
+            name='refresh_interval',
+            field=models.IntegerField(
+                help_text='number of minutes between refreshes adapted to '
+                          'the articles yield',
+                null=True),
+        ),
+        migrations.AlterField(
+            model_name='target',
+            name='expired_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='target',
+            name='refresh_frequency',
+            field=models.IntegerField(
+                default=2,
+                help_text='initial number of hours between refreshes'),
+        ),
+    ]
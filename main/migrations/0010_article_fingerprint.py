@@ -0,0 +1,42 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:42
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_target_adaptive_refresh'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='duplicate_of',
+            field=models.ForeignKey(
+                help_text='analyzed article whose reports have been reused',
+                null=True, on_delete=django.db.models.deletion.SET_NULL,
+                related_name='duplicates', to='main.Article'),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='fingerprint',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(), null=True, size=None),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='fingerprint_bands',
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(), null=True, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['fingerprint_bands'],
+                name='main_articl_fingerp_c0fde1_gin'),
+        ),
+    ]
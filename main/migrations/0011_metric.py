@@ -0,0 +1,27 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_article_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Metric',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('labels', models.CharField(blank=True, default='',
+                                            max_length=1000)),
+                ('value', models.FloatField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'labels')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.1.4 on 2026-10-16 23:53
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+
+
+def backfill_search_vector(apps, schema_editor):
+    """
+    Sets the search vector of the articles already stored
+    """
+    Article = apps.get_model('main', 'Article')
+    Article.objects.update(
+        search_vector=SearchVector('title', weight='A',
+                                   config=settings.SEARCH_CONFIG) +
+        SearchVector('snippet', weight='B', config=settings.SEARCH_CONFIG))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_metric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vector,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='article',
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=['search_vector'],
+                name='main_articl_search__db3b43_gin'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.1.4 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_article_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiservice',
+            name='failures',
+            field=models.IntegerField(
+                default=0, help_text='number of consecutive failed calls'),
+        ),
+        migrations.AddField(
+            model_name='apiservice',
+            name='opened_at',
+            field=models.DateTimeField(
+                blank=True, null=True,
+                help_text='time the circuit breaker opened, empty if closed'),
+        ),
+        migrations.AddField(
+            model_name='apiservice',
+            name='probe_at',
+            field=models.DateTimeField(
+                blank=True, null=True,
+                help_text='time of the call probing the API while the '
+                          'circuit is open'),
+        ),
+    ]
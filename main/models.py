@@ -1,10 +1,19 @@
 import hashlib
 
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models, transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
+from django.utils import timezone
+
+from main.utils import minhash_similarity
 
 
 class Article(models.Model):
@@ -17,6 +26,19 @@ class Article(models.Model):
     uid = models.CharField(max_length=256, unique=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # MinHash signature of title+snippet and its LSH keys, to find the
+    # syndicated copies of the same story
+    fingerprint = ArrayField(models.BigIntegerField(), null=True)
+    fingerprint_bands = ArrayField(models.BigIntegerField(), null=True)
+    duplicate_of = models.ForeignKey('self', null=True, on_delete=models.SET_NULL,
+                                     related_name='duplicates',
+                                     help_text='analyzed article whose reports '
+                                               'have been reused')
+
+    # lexemes of the title (weight A) and the snippet (weight B) for the
+    # full-text search, set on insert
+    search_vector = SearchVectorField(null=True, editable=False)
+
     """
     sentiment_data structure:
     { 'reports': [{
@@ -30,11 +52,17 @@ class Article(models.Model):
                   ...
                  ]
     }
+    Only the latest SENTIMENT_REPORTS_PER_KEYWORD reports of each target keyword are kept
     """
     sentiment_data = JSONField(null=True)
 
     class Meta:
         ordering = ('-published_at',)
+        indexes = [
+            models.Index(fields=['-published_at', '-id']),
+            GinIndex(fields=['fingerprint_bands']),
+            GinIndex(fields=['search_vector']),
+        ]
 
     def __str__(self):
         return 'ART%d:%s' % (self.id, self.uid)
@@ -46,10 +74,160 @@ class Article(models.Model):
         to prevent duplicates
         """
         super(Article, self).__init__(*args, **kwargs)
-        if not self.uid:
+        # a deferred uid has been stored already, don't load it
+        if 'uid' not in self.get_deferred_fields() and not self.uid:
             signature = str(self.url) + str(self.title) + str(self.published_at)
             self.uid = hashlib.sha256(signature.encode('utf-8')).hexdigest()
 
+    @classmethod
+    def insert_new(cls, articles, batch_size=500):
+        """
+        Inserts the given articles skipping the ones already stored, with a single
+        INSERT ... ON CONFLICT (uid) DO NOTHING statement for each batch, so concurrent
+        scrapes of the same articles can't fail on the unique uid.
+        The search vector is computed by the same statement.
+        Returns the set of the uids actually inserted
+        """
+        fields = [field for field in cls._meta.concrete_fields
+                  if not field.primary_key and field.name != 'search_vector']
+        columns = ', '.join(connection.ops.quote_name(field.column)
+                            for field in fields + [cls._meta.get_field('search_vector')])
+        # as search_vector_expression()
+        row_placeholder = '(%s, %s)' % (', '.join(['%s'] * len(fields)),
+                                        "setweight(to_tsvector(%s::regconfig, COALESCE(%s, '')), 'A') || "
+                                        "setweight(to_tsvector(%s::regconfig, COALESCE(%s, '')), 'B')")
+
+        inserted = set()
+        with connection.cursor() as cursor:
+            for start in range(0, len(articles), batch_size):
+                batch = articles[start:start + batch_size]
+                params = []
+                for article in batch:
+                    params += [field.get_db_prep_save(field.pre_save(article, True), connection)
+                               for field in fields]
+                    params += [settings.SEARCH_CONFIG, article.title, settings.SEARCH_CONFIG, article.snippet]
+                cursor.execute('INSERT INTO %s (%s) VALUES %s ON CONFLICT (uid) DO NOTHING RETURNING uid'
+                               % (connection.ops.quote_name(cls._meta.db_table), columns,
+                                  ', '.join([row_placeholder] * len(batch))), params)
+                inserted.update(uid for uid, in cursor.fetchall())
+        return inserted
+
+    @staticmethod
+    def search_vector_expression():
+        """
+        Expression of the search vector, to update the articles not inserted by insert_new()
+        """
+        return SearchVector('title', weight='A', config=settings.SEARCH_CONFIG) + \
+            SearchVector('snippet', weight='B', config=settings.SEARCH_CONFIG)
+
+    @classmethod
+    def update_analyses(cls, analyses):
+        """
+        Adds the new reports of the given (article, reports) analyses in front of the
+        stored ones and saves the duplicate_of of the articles with a single
+        UPDATE ... FROM (VALUES ...) statement (bulk_update is only available from Django 2.2).
+        Only the new reports are sent: the db edits the stored sentiment_data in place,
+        keeping the latest SENTIMENT_REPORTS_PER_KEYWORD reports of each keyword, so the
+        concurrent analyses of an article don't overwrite each other.
+        The sentiment_data of the articles is set to the result
+        """
+        if not analyses:
+            return
+
+        sentiment_data = cls._meta.get_field('sentiment_data')
+        params = []
+        for article, reports in analyses:
+            params += [article.id, sentiment_data.get_db_prep_save(reports, connection), article.duplicate_of_id]
+        table = connection.ops.quote_name(cls._meta.db_table)
+        reports = cls._latest_reports_sql("v.reports::jsonb || COALESCE(%s.sentiment_data->'reports', '[]'::jsonb)"
+                                         % table, settings.SENTIMENT_REPORTS_PER_KEYWORD)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE %s SET sentiment_data = jsonb_set(COALESCE(%s.sentiment_data, '{}'::jsonb), "
+                           "'{reports}', %s), duplicate_of_id = v.duplicate_of_id::integer "
+                           "FROM (VALUES %s) AS v (id, reports, duplicate_of_id) WHERE %s.id = v.id "
+                           "RETURNING %s.id, %s.sentiment_data"
+                           % (table, table, reports, ', '.join(['(%s, %s, %s)'] * len(analyses)),
+                              table, table, table), params)
+            stored = dict(cursor.fetchall())
+        for article, _ in analyses:
+            article.sentiment_data = stored.get(article.id, article.sentiment_data)
+
+    @classmethod
+    def compact_reports(cls, keep, start_id, end_id):
+        """
+        Keeps the latest keep reports of each keyword in the sentiment_data of the
+        articles with id in [start_id, end_id), with a single in place UPDATE.
+        Returns the number of articles compacted
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        reports = cls._latest_reports_sql("sentiment_data->'reports'", keep)
+        with connection.cursor() as cursor:
+            # only the articles with more than keep reports can have too many for a keyword,
+            # and only the ones actually trimmed are written
+            cursor.execute("UPDATE %s SET sentiment_data = jsonb_set(%s.sentiment_data, '{reports}', c.reports) "
+                           "FROM (SELECT id, %s AS reports FROM %s WHERE id >= %%s AND id < %%s "
+                           "AND jsonb_array_length(sentiment_data->'reports') > %%s) AS c "
+                           "WHERE %s.id = c.id AND jsonb_array_length(c.reports) < "
+                           "jsonb_array_length(%s.sentiment_data->'reports')"
+                           % (table, table, reports, table, table, table), [start_id, end_id, keep])
+            return cursor.rowcount
+
+    @staticmethod
+    def _latest_reports_sql(reports, keep):
+        """
+        SQL expression of the given jsonb array of reports (most recent first) keeping
+        only the first keep reports of each target keyword, or all of them if keep is 0
+        """
+        if not keep:
+            return reports
+        return ("(SELECT COALESCE(jsonb_agg(report ORDER BY position), '[]'::jsonb) FROM ("
+                "SELECT report, position, row_number() OVER (PARTITION BY lower(report->>'target_keyword') "
+                "ORDER BY position) AS keyword_rank "
+                "FROM jsonb_array_elements(%s) WITH ORDINALITY AS reports (report, position)) AS ranked "
+                "WHERE keyword_rank <= %d)" % (reports, keep))
+
+    @classmethod
+    def find_duplicates(cls, articles):
+        """
+        Returns the already analyzed article most similar to each of the given ones,
+        by article id, for the ones whose estimated similarity is at least
+        DUPLICATE_SIMILARITY and published within DUPLICATE_WINDOW_DAYS of them.
+        The articles without a snippet are never duplicates. All the articles are
+        looked up with two queries
+        """
+        articles = [article for article in articles if article.fingerprint_bands and article.snippet]
+        if not articles:
+            return {}
+
+        window = timedelta(days=settings.DUPLICATE_WINDOW_DAYS)
+        bands = {band for article in articles for band in article.fingerprint_bands}
+        published = [article.published_at for article in articles]
+        candidates = cls.objects.filter(fingerprint_bands__overlap=list(bands),
+                                        published_at__range=(min(published) - window, max(published) + window),
+                                        snippet__gt='',
+                                        duplicate_of__isnull=True,
+                                        sentiment_data__isnull=False)\
+            .values_list('id', 'published_at', 'fingerprint', 'fingerprint_bands')
+        candidates = list(candidates[:settings.DUPLICATE_MAX_CANDIDATES * len(articles)])
+
+        best_ids = {}
+        for article in articles:
+            article_bands = set(article.fingerprint_bands)
+            best_id, best_similarity = None, settings.DUPLICATE_SIMILARITY
+            for article_id, published_at, fingerprint, candidate_bands in candidates:
+                if article_id == article.id or article_bands.isdisjoint(candidate_bands) \
+                        or abs(published_at - article.published_at) > window:
+                    continue
+                similarity = minhash_similarity(article.fingerprint, fingerprint)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = article_id, similarity
+            if best_id:
+                best_ids[article.id] = best_id
+
+        duplicates = cls.objects.in_bulk(set(best_ids.values()))
+        return {article_id: duplicates[best_id] for article_id, best_id in best_ids.items()
+                if best_id in duplicates}
+
     @property
     def sentiment_last_report(self):
         if self.sentiment_data:
@@ -60,19 +238,24 @@ class Article(models.Model):
     def sentiment_keywords(self):
         kw = []
         if self.sentiment_data:
+            seen = set()
             for rep in self.sentiment_data['reports']:
-                kw.extend(rep.get('article_keywords_scores', []))
+                # the reports of a multi-target analysis share the same keywords
+                for keyword, score in rep.get('article_keywords_scores', []):
+                    if keyword not in seen:
+                        seen.add(keyword)
+                        kw.append((keyword, score))
         return kw
 
     @staticmethod
-    def get_score_data(queryset):
+    def get_score_data(reports):
         """
         Returns a dict of keyword targets and their (date, score) list of
-        data points using the first report of the queryset
+        data points from the given SentimentReport queryset
         """
-        scores = queryset.values_list('published_at',
-                                      'sentiment_data__reports__0__target_keyword',
-                                      'sentiment_data__reports__0__target_keyword_score')
+        scores = reports.values_list('published_at',
+                                     'target_keyword__keyword',
+                                     'target_keyword_score')
 
         data = {}
         for pubdate, kw, score in scores:
@@ -85,13 +268,13 @@ class Article(models.Model):
         return data
 
     @classmethod
-    def get_score_averages(cls, queryset):
+    def get_score_averages(cls, reports):
         """
         Returns the (average score, number of data points) for each
-        target keyword
+        target keyword of the given SentimentReport queryset
         """
 
-        scores = cls.get_score_data(queryset)
+        scores = cls.get_score_data(reports)
         averages = {}
         for kw, values in scores.items():
             averages[kw] = (sum([score for _, score in values]) / len(values),
@@ -104,14 +287,56 @@ class Target(models.Model):
     keyword = models.CharField(max_length=50)
     active = models.BooleanField(default=True)
     refresh_frequency = models.IntegerField(default=2,
-                                            help_text='minimum number of hours '
+                                            help_text='initial number of hours '
                                                       'between refreshes')
-    expired_at = models.DateTimeField(null=True)
+    refresh_interval = models.IntegerField(null=True,
+                                           help_text='number of minutes between '
+                                                     'refreshes adapted to the '
+                                                     'articles yield')
+    last_yield = models.IntegerField(null=True,
+                                     help_text='number of new articles found '
+                                               'by the last refresh')
+    expired_at = models.DateTimeField(null=True, db_index=True)
+    backfilled_until = models.DateField(null=True,
+                                        help_text='oldest day of the historic '
+                                                  'articles already fetched')
+    reports_updated_at = models.DateTimeField(null=True,
+                                              help_text='time of the last sentiment '
+                                                        'report stored')
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return 'KW%d:%s' % (self.id, self.keyword)
 
+    def get_refresh_interval(self):
+        """
+        Minutes between two refreshes, starting from refresh_frequency
+        until the first refresh adapts it
+        """
+        return self.refresh_interval or self.refresh_frequency * 60
+
+    def schedule_next_refresh(self, new_articles, now=None):
+        """
+        Adapt the refresh interval to the number of new articles found by the
+        last refresh and set the new expiration time: the interval shrinks when
+        the keyword yields more than REFRESH_TARGET_YIELD articles and grows when
+        it yields less, at most by a factor 2 each time and within the
+        REFRESH_MIN_INTERVAL and REFRESH_MAX_INTERVAL bounds
+        """
+        if new_articles:
+            factor = float(settings.REFRESH_TARGET_YIELD) / new_articles
+        else:
+            factor = 2
+        factor = min(max(factor, 0.5), 2)
+
+        interval = int(round(self.get_refresh_interval() * factor))
+        interval = min(max(interval, settings.REFRESH_MIN_INTERVAL), settings.REFRESH_MAX_INTERVAL)
+
+        self.refresh_interval = interval
+        self.last_yield = new_articles
+        self.expired_at = (now or timezone.now()) + timedelta(minutes=interval)
+        self.save(update_fields=['refresh_interval', 'last_yield', 'expired_at'])
+
 
 class UserTarget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -124,6 +349,262 @@ class UserTarget(models.Model):
         unique_together = ('user', 'target_keyword')
 
 
+class SentimentReport(models.Model):
+    """
+    Latest sentiment report of an article for a target keyword, mirroring the
+    reports stored in Article.sentiment_data so that they can be queried
+    through indexed joins
+    """
+    article = models.ForeignKey(Article, on_delete=models.CASCADE,
+                                related_name='reports')
+    target_keyword = models.ForeignKey(Target, on_delete=models.CASCADE,
+                                       related_name='reports')
+    target_keyword_score = models.FloatField(null=True)
+    global_score = models.FloatField(null=True)
+    # denormalized from the article to sort and filter without joining it
+    published_at = models.DateTimeField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-published_at',)
+        unique_together = ('article', 'target_keyword')
+        indexes = [
+            models.Index(fields=['target_keyword', '-published_at']),
+        ]
+
+    def __str__(self):
+        return 'REP%d:%s:%s' % (self.id, self.article_id, self.target_keyword_id)
+
+    @classmethod
+    def store_many(cls, analyses):
+        """
+        Creates or updates the reports of the given (article, sentiment_data reports)
+        analyses, for the keywords that are still targets, with an INSERT and an
+        UPDATE statement, and updates the daily rollups accordingly in the same
+        transaction.
+        Returns the (article, reports stored) of each analysis
+        """
+        keywords = {rep['target_keyword'] for _, reports in analyses for rep in reports if rep['target_keyword']}
+        targets_by_keyword = {}
+        for target in Target.objects.filter(keyword__in=keywords):
+            targets_by_keyword.setdefault(target.keyword, []).append(target)
+        if not targets_by_keyword:
+            return [(article, []) for article, _ in analyses]
+
+        target_ids = [target.id for targets in targets_by_keyword.values() for target in targets]
+
+        # a single report for each (article, target): a row can't be upserted twice by a statement
+        now = timezone.now()
+        stored = OrderedDict()
+        for article, reports in analyses:
+            for rep in reports:
+                for target in targets_by_keyword.get(rep['target_keyword'], []):
+                    stored[(article.id, target.id)] = cls(
+                        article=article, target_keyword=target,
+                        target_keyword_score=rep.get('target_keyword_score'),
+                        global_score=rep.get('global_score'),
+                        published_at=article.published_at, created_at=now)
+        if not stored:
+            return [(article, []) for article, _ in analyses]
+
+        with transaction.atomic():
+            previous_scores = cls._upsert(stored)
+            DailySentiment.add_scores([(target_id, report.published_at, report.target_keyword_score,
+                                        previous_scores[(article_id, target_id)])
+                                       for (article_id, target_id), report in stored.items()
+                                       if (article_id, target_id) in previous_scores])
+
+        # invalidates the cached dashboards of the keywords
+        Target.objects.filter(id__in=target_ids).update(reports_updated_at=now)
+
+        by_article = {}
+        for (article_id, _), report in stored.items():
+            by_article.setdefault(article_id, []).append(report)
+        return [(article, by_article.get(article.id, [])) for article, _ in analyses]
+
+    @classmethod
+    def _upsert(cls, stored):
+        """
+        Inserts the given reports, by (article id, target id), or updates the
+        existing ones, setting their ids.
+        Returns the score each report replaced (None for the inserted ones), read
+        from the rows locked by the update, so the concurrent analyses of an article
+        don't replace the same score twice
+        """
+        fields = [cls._meta.get_field(name) for name in ('article', 'target_keyword', 'target_keyword_score',
+                                                         'global_score', 'published_at', 'created_at')]
+        table = connection.ops.quote_name(cls._meta.db_table)
+        row = '(%s)' % ', '.join('CAST(%%s AS %s)' % field.db_type(connection) for field in fields)
+
+        def rows_params(keys):
+            params = []
+            for key in keys:
+                params += [field.get_db_prep_save(field.pre_save(stored[key], True), connection) for field in fields]
+            return params
+
+        previous_scores = {}
+        # always in the same order, so concurrent upserts don't deadlock
+        keys = sorted(stored)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO %s (%s) VALUES %s ON CONFLICT (article_id, target_keyword_id) DO NOTHING '
+                           'RETURNING id, article_id, target_keyword_id'
+                           % (table, ', '.join(field.column for field in fields), ', '.join([row] * len(keys))),
+                           rows_params(keys))
+            for report_id, article_id, target_id in cursor.fetchall():
+                stored[(article_id, target_id)].id = report_id
+                previous_scores[(article_id, target_id)] = None
+
+            # the others already exist (or were just inserted by a concurrent analysis)
+            keys = [key for key in keys if key not in previous_scores]
+            if keys:
+                cursor.execute('UPDATE %s AS report SET %s FROM (VALUES %s) AS new (%s), '
+                               '(SELECT id, target_keyword_score FROM %s WHERE (article_id, target_keyword_id) IN (%s) '
+                               'ORDER BY id FOR UPDATE) AS old '
+                               'WHERE report.id = old.id AND report.article_id = new.article_id '
+                               'AND report.target_keyword_id = new.target_keyword_id '
+                               'RETURNING report.id, report.article_id, report.target_keyword_id, '
+                               'old.target_keyword_score'
+                               % (table, ', '.join('%s = new.%s' % (field.column, field.column) for field in fields[2:]),
+                                  ', '.join([row] * len(keys)), ', '.join(field.column for field in fields),
+                                  table, ', '.join(['(%s, %s)'] * len(keys))),
+                               rows_params(keys) + [value for key in keys for value in key])
+                for report_id, article_id, target_id, previous_score in cursor.fetchall():
+                    stored[(article_id, target_id)].id = report_id
+                    previous_scores[(article_id, target_id)] = previous_score
+        return previous_scores
+
+
+class DailySentiment(models.Model):
+    """
+    Daily rollup of the target keyword scores of the reports, by day of
+    publication of the articles
+    """
+    target_keyword = models.ForeignKey(Target, on_delete=models.CASCADE,
+                                       related_name='daily_sentiment')
+    day = models.DateField()
+    score_sum = models.FloatField(default=0)
+    score_count = models.IntegerField(default=0)
+    score_min = models.FloatField(null=True)
+    score_max = models.FloatField(null=True)
+
+    class Meta:
+        ordering = ('day',)
+        unique_together = ('target_keyword', 'day')
+
+    def __str__(self):
+        return 'DAY%d:%s:%s' % (self.id, self.target_keyword_id, self.day)
+
+    @classmethod
+    def add_scores(cls, scores):
+        """
+        Adds the scores of the given (target id, published_at, score, previous score)
+        reports to the rollups of their days, replacing the previous score of the
+        reports updated, with a single INSERT ... ON CONFLICT DO UPDATE statement.
+        The min and max are only widened: rebuild_daily_sentiment recomputes them
+        """
+        # sum, count, min and max to add to each rollup
+        deltas = {}
+        for target_id, published_at, score, previous_score in scores:
+            if score is None and previous_score is None:
+                continue
+
+            if timezone.is_aware(published_at):
+                published_at = timezone.localtime(published_at, timezone.utc)
+            delta = deltas.setdefault((target_id, published_at.date()), [0, 0, None, None])
+            delta[0] += (score or 0) - (previous_score or 0)
+            delta[1] += int(score is not None) - int(previous_score is not None)
+            if score is not None:
+                delta[2] = score if delta[2] is None else min(delta[2], score)
+                delta[3] = score if delta[3] is None else max(delta[3], score)
+        if not deltas:
+            return
+
+        params = []
+        # always in the same order, so concurrent updates don't deadlock
+        for (target_id, day), delta in sorted(deltas.items()):
+            params += [target_id, day] + delta
+        table = connection.ops.quote_name(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO %s (target_keyword_id, day, score_sum, score_count, score_min, score_max) '
+                           'VALUES %s ON CONFLICT (target_keyword_id, day) DO UPDATE SET '
+                           'score_sum = %s.score_sum + EXCLUDED.score_sum, '
+                           'score_count = %s.score_count + EXCLUDED.score_count, '
+                           'score_min = LEAST(%s.score_min, EXCLUDED.score_min), '
+                           'score_max = GREATEST(%s.score_max, EXCLUDED.score_max)'
+                           % ((table, ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(deltas))) + (table,) * 4),
+                           params)
+
+    @staticmethod
+    def get_score_data(targets, since):
+        """
+        Returns a dict of keyword targets and their (day, average score) list
+        of data points from the given day onwards
+        """
+        rollups = DailySentiment.objects.filter(target_keyword__in=targets, day__gte=since,
+                                                score_count__gt=0)\
+            .values_list('target_keyword__keyword', 'day', 'score_sum', 'score_count')
+
+        data = {}
+        for kw, day, score_sum, score_count in rollups:
+            data.setdefault(kw, []).append((day, score_sum / score_count))
+        return data
+
+
+class NLUCacheEntry(models.Model):
+    """
+    NLU analysis response cached by normalized article url and target keywords
+    """
+    key = models.CharField(max_length=64, unique=True)
+    response = JSONField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return 'NLU%d:%s' % (self.id, self.key)
+
+
+class APIService(models.Model):
+    """
+    State of an external API shared by all the workers: the token bucket
+    enforcing its rate limit, its circuit breaker and the counters of the calls
+    """
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField(null=True)
+    granted = models.BigIntegerField(default=0,
+                                     help_text='number of calls allowed')
+    throttled = models.BigIntegerField(default=0,
+                                       help_text='number of waits for the '
+                                                 'rate limit')
+    failures = models.IntegerField(default=0,
+                                   help_text='number of consecutive failed calls')
+    opened_at = models.DateTimeField(null=True, blank=True,
+                                     help_text='time the circuit breaker opened, '
+                                               'empty if closed')
+    probe_at = models.DateTimeField(null=True, blank=True,
+                                    help_text='time of the call probing the API '
+                                              'while the circuit is open')
+
+    def __str__(self):
+        return 'API%d:%s' % (self.id, self.name)
+
+
+class Metric(models.Model):
+    """
+    Value of a sample of the pipeline metrics, summed over all the processes
+    (see main.metrics)
+    """
+    name = models.CharField(max_length=200)
+    labels = models.CharField(max_length=1000, blank=True, default='')
+    value = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('name', 'labels')
+
+    def __str__(self):
+        return '%s{%s}' % (self.name, self.labels)
+
+
 @receiver(post_save, sender=Target)
 def submit_scraper_for_new_target(sender, instance, created, *args, **kwargs):
     """
@@ -142,5 +623,5 @@ def delete_target_with_no_users(sender, instance, *args, **kwargs):
     """
     Signal to remove a keyword if no users use it
     """
-    if instance.target_keyword.users.count() == 0:
-        instance.target_keyword.delete()
+    # by id, the keyword may be gone already when deleted along with the user
+    Target.objects.filter(id=instance.target_keyword_id, users__isnull=True).delete()
@@ -0,0 +1,114 @@
+import base64
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def link_header_response(data, next_link):
+    """
+    Response with the page as a plain list, the shape of the unpaginated API, and
+    the link to the next page, if any, in the Link header
+    """
+    headers = {'Link': '<%s>; rel="next"' % next_link} if next_link else None
+    return Response(data, headers=headers)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination of the articles newest first, walking the
+    (published_at, id) keyset so that every page is an indexed range scan
+    regardless of its depth
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 50
+    max_limit = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+
+        position = self.decode_cursor(request)
+        if position:
+            published_at, pk = position
+            queryset = queryset.filter(Q(published_at__lt=published_at) |
+                                       Q(published_at=published_at, id__lt=pk))
+
+        page = list(queryset.order_by('-published_at', '-id')[:self.limit + 1])
+        self.next_position = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            self.next_position = (page[-1].published_at, page[-1].id)
+        return page
+
+    def get_paginated_response(self, data):
+        return link_header_response(data, self.get_next_link())
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(max(limit, 1), self.max_limit)
+
+    def get_next_link(self):
+        if not self.next_position:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    @staticmethod
+    def encode_cursor(position):
+        published_at, pk = position
+        cursor = '%s|%d' % (published_at.isoformat(), pk)
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            published_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii'))\
+                .decode('utf-8').split('|')
+            published_at = parse_datetime(published_at)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound('Invalid cursor')
+        if published_at is None:
+            raise NotFound('Invalid cursor')
+        return published_at, pk
+
+
+class SearchPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination of the search results, the most relevant first.
+    Fetches one result more than the page to know if there is a next one,
+    instead of counting all the matches
+    """
+    default_limit = 50
+    max_limit = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+
+        page = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(page) > self.limit
+        return page[:self.limit]
+
+    def get_paginated_response(self, data):
+        return link_header_response(data, self.get_next_link())
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
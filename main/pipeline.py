@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from main.models import Article
+from main.circuit import ServiceUnavailable
+from main.utils import close_thread_connections
+
+log = logging.getLogger(__name__)
+
+
+def analyze_batch(analyzer, article_uids, keywords, concurrency=None):
+    """
+    Runs the sentiment analysis of the given articles with up to concurrency
+    (NLU_CONCURRENCY by default) requests in flight at the same time, or as a
+    single batch if the analyzer is not remote.
+    The blocking API calls are run in a thread pool driven by an asyncio loop,
+    which also bounds the requests in flight, then the results are all stored
+    at once from the loop thread.
+    Returns the number of articles analyzed. If the API is unavailable (rate
+    limit exceeded, failed calls, open circuit), ServiceUnavailable is raised once
+    the other articles are done, listing the articles left in its article_uids attribute
+    """
+    concurrency = concurrency or settings.NLU_CONCURRENCY
+    keywords = analyzer._as_keywords(keywords)
+    articles = list(Article.objects.filter(uid__in=article_uids))
+    if not articles:
+        return 0
+
+    if not analyzer.remote:
+        # an in-process analyzer scores all the articles at once
+        responses = analyzer.analyze_many(articles, keywords=keywords)
+        analyses = []
+        for article, response in zip(articles, responses):
+            reports = analyzer._parse_response(response, keywords) if response else None
+            if reports:
+                analyses.append((article, reports))
+        analyzer.store_many(analyses)
+        log.debug("analyzed %d/%d articles" % (len(analyses), len(articles)))
+        return len(analyses)
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        return loop.run_until_complete(_analyze_all(loop, executor, analyzer, articles, keywords))
+    finally:
+        close_thread_connections(executor, concurrency)
+        executor.shutdown(wait=True)
+        loop.close()
+
+
+async def _analyze_all(loop, executor, analyzer, articles, keywords):
+    analyses = []
+    deferred = []
+    # looked up for the whole batch before any request, not to hold up the loop
+    duplicates = analyzer.duplicate_reports_many(articles, keywords=keywords)
+
+    async def analyze(article):
+        reports = duplicates.get(article.id)
+        if not reports:
+            try:
+                response = await loop.run_in_executor(executor, analyzer._analyze, article, keywords)
+                reports = analyzer._parse_response(response, keywords) if response else None
+            except ServiceUnavailable as e:
+                deferred.append((article.uid, e))
+                return False
+            except Exception as e:
+                # the analyses of the other articles are stored anyway
+                log.error('analysis of %s failed: %s' % (article, e))
+                return False
+        if not reports:
+            return False
+        analyses.append((article, reports))
+        return True
+
+    results = await asyncio.gather(*[analyze(article) for article in articles])
+    analyzer.store_many(analyses)
+    log.debug("analyzed %d/%d articles, cache %s" % (sum(results), len(articles),
+                                                     analyzer.stats()))
+
+    if deferred:
+        # let the caller reschedule the articles not analyzed
+        exception = max((e for _, e in deferred), key=lambda e: e.retry_after)
+        exception.article_uids = [uid for uid, _ in deferred]
+        raise exception
+    return sum(results)
+
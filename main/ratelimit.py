@@ -0,0 +1,84 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from main.circuit import ServiceUnavailable
+from main.models import APIService
+
+log = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(ServiceUnavailable):
+    """
+    Raised when an API call can't be made within the maximum wait time,
+    retry_after is the number of seconds before a call will be allowed
+    """
+
+    def __init__(self, service, retry_after):
+        super(RateLimitExceeded, self).__init__(service, retry_after, '%s rate limit exceeded, retry in %.1fs' %
+                                                (service, retry_after))
+
+    def retry_delay(self, attempt):
+        # the call will be allowed then, no need to back off
+        return self.retry_after
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter shared by all the processes through the
+    APIService row of the API, locked for the update of its tokens.
+    The budget of each API is set in API_RATE_LIMITS as (calls per second, burst)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rate, self.burst = settings.API_RATE_LIMITS[name]
+
+    def try_acquire(self):
+        """
+        Takes a token from the bucket if available.
+        Returns 0 if the call is allowed or the number of seconds to wait
+        before a token will be available
+        """
+        with transaction.atomic():
+            service, created = APIService.objects.select_for_update().get_or_create(
+                name=self.name, defaults={'tokens': self.burst, 'refilled_at': timezone.now()})
+
+            # once the row is locked
+            now = timezone.now()
+            elapsed = (now - service.refilled_at).total_seconds() if service.refilled_at else 0
+            tokens = min(self.burst, service.tokens + max(elapsed, 0) * self.rate)
+            if tokens >= 1:
+                service.tokens = tokens - 1
+                service.granted += 1
+                wait = 0
+            else:
+                service.tokens = tokens
+                service.throttled += 1
+                wait = (1 - tokens) / self.rate
+            service.refilled_at = now
+            service.save(update_fields=['tokens', 'refilled_at', 'granted', 'throttled'])
+
+        return wait
+
+    def acquire(self, max_wait=None):
+        """
+        Waits until a call is allowed, raises RateLimitExceeded if that takes
+        longer than max_wait seconds (API_RATE_LIMIT_MAX_WAIT by default)
+        """
+        if max_wait is None:
+            max_wait = settings.API_RATE_LIMIT_MAX_WAIT
+
+        waited = 0
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            if waited + wait > max_wait:
+                raise RateLimitExceeded(self.name, wait)
+            log.debug("%s rate limit: waiting %.1fs" % (self.name, wait))
+            time.sleep(wait)
+            waited += wait
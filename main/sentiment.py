@@ -0,0 +1,196 @@
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+LEXICON_PATH = os.path.join(os.path.dirname(__file__), 'data', 'sentiment_lexicon.txt')
+
+NEGATIONS = {'no', 'not', 'never', 'none', 'nobody', 'nothing', 'neither', 'nor',
+             'without', 'cannot', 'hardly'}
+# change of the score of the word following an intensifier
+BOOSTERS = {'very': 0.3, 'really': 0.3, 'extremely': 0.5, 'highly': 0.3, 'hugely': 0.5,
+            'most': 0.3, 'more': 0.2, 'so': 0.2, 'too': 0.2, 'sharply': 0.5, 'deeply': 0.3,
+            'slightly': -0.3, 'somewhat': -0.3, 'barely': -0.5, 'less': -0.2, 'little': -0.3}
+STOPWORDS = {'the', 'and', 'for', 'that', 'with', 'this', 'from', 'are', 'was', 'were', 'has',
+             'have', 'had', 'its', 'his', 'her', 'their', 'they', 'them', 'will', 'would', 'could',
+             'should', 'can', 'but', 'not', 'you', 'your', 'our', 'who', 'what', 'which', 'when',
+             'where', 'how', 'why', 'all', 'any', 'been', 'being', 'into', 'over', 'than', 'then',
+             'there', 'these', 'those', 'also', 'just', 'about', 'after', 'before', 'more', 'most',
+             'some', 'such', 'only', 'other', 'out', 'said', 'says', 'new', 'one', 'two', 'year',
+             'years', 'now', 'may', 'did', 'does', 'very', 'here', 'while', 'because', 'chars'}
+
+# irregular forms of the lexicon words
+IRREGULAR_FORMS = {'fell': 'fall', 'fallen': 'fall', 'risen': 'rise', 'grew': 'grow', 'grown': 'grow',
+                   'won': 'win', 'beaten': 'beat', 'slid': 'slide'}
+# endings of the inflected forms and their replacement, tried in order to find a lexicon word
+SUFFIXES = (('ies', 'y'), ('ied', 'y'), ('es', ''), ('s', ''), ('ed', ''), ('d', ''), ('ing', ''), ('ing', 'e'))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+TRUNCATION_RE = re.compile(r'\[\+\d+ chars\]')
+
+
+class SentimentEngine(object):
+    """
+    Lexicon based sentiment analysis of short texts, returning the document,
+    targets and keywords sentiment in the format of the NLU service responses.
+    The texts of a batch are scored together: the words are looked up in the
+    lexicon once and the negations, intensifiers and totals are computed on
+    the arrays of all the words of the batch
+    """
+    # number of words after a negation whose score is inverted
+    NEGATION_SCOPE = 3
+    NEGATION_FACTOR = -0.74
+    # number of words around a target or keyword scored for it
+    WINDOW = 8
+    # normalization of the sum of the scores in (-1, 1)
+    ALPHA = 15
+    KEYWORDS_LIMIT = 5
+
+    def __init__(self, lexicon_path=LEXICON_PATH):
+        self.lexicon = {}
+        with open(lexicon_path) as lexicon_file:
+            for line in lexicon_file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    word, score = line.split()
+                    self.lexicon[word] = float(score)
+        # score (or None) of the words looked up so far, inflected forms included
+        self._scores = {}
+
+    def lookup(self, word):
+        """
+        Returns the score of the given word, or of the lexicon word it is an
+        inflected form of (plural, past, -ing), None if it is not in the lexicon
+        """
+        try:
+            return self._scores[word]
+        except KeyError:
+            pass
+
+        score = self.lexicon.get(word)
+        if score is None and word in IRREGULAR_FORMS:
+            score = self.lexicon.get(IRREGULAR_FORMS[word])
+        if score is None:
+            for suffix, replacement in SUFFIXES:
+                if len(word) > len(suffix) + 2 and word.endswith(suffix) and not word.endswith('ss'):
+                    stem = word[:-len(suffix)]
+                    score = self.lexicon.get(stem + replacement)
+                    # doubled consonant: dropped, cutting
+                    if score is None and not replacement and len(stem) > 2 and stem[-1] == stem[-2]:
+                        score = self.lexicon.get(stem[:-1])
+                    if score is not None:
+                        break
+        self._scores[word] = score
+        return score
+
+    @staticmethod
+    def tokenize(text):
+        if not text:
+            return []
+        return TOKEN_RE.findall(TRUNCATION_RE.sub(' ', text.lower()))
+
+    def analyze(self, texts, targets=None):
+        """
+        Returns the list of the analysis of each of the given texts for the given
+        target keywords, or None for the texts without words
+        """
+        docs = [self.tokenize(text) for text in texts]
+        tokens = [token for doc in docs for token in doc]
+        lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+
+        scores = np.array([self.lookup(token) or 0.0 for token in tokens], dtype=np.float64)
+        negations = np.array([token in NEGATIONS or token.endswith("n't") for token in tokens], dtype=bool)
+        boosters = np.array([BOOSTERS.get(token, 0.0) for token in tokens], dtype=np.float64)
+        # position of each word in its own text, so the rules don't cross the texts
+        positions = np.arange(len(tokens)) - np.repeat(starts, lengths)
+
+        if len(tokens):
+            factors = np.ones(len(tokens))
+            factors[1:] += boosters[:-1] * (positions[1:] >= 1)
+            negated = np.zeros(len(tokens), dtype=bool)
+            for distance in range(1, self.NEGATION_SCOPE + 1):
+                negated[distance:] |= negations[:-distance] & (positions[distance:] >= distance)
+            factors[negated] *= self.NEGATION_FACTOR
+            scores *= factors
+
+        sums = np.concatenate([[0.0], np.cumsum(scores)])
+        documents = self._normalize(sums[ends] - sums[starts])
+
+        targets = [(target, self.tokenize(target)) for target in targets or []]
+        results = []
+        for index, doc in enumerate(docs):
+            if not doc:
+                results.append(None)
+                continue
+            doc_scores = scores[starts[index]:ends[index]]
+
+            response = {'sentiment': {'document': self._sentiment(documents[index])},
+                        'keywords': self._keywords(doc, doc_scores),
+                        'language': 'en'}
+            if targets:
+                response['sentiment']['targets'] = []
+                for target, target_tokens in targets:
+                    mentions = self._find(doc, target_tokens)
+                    if mentions:
+                        score = self._window_score(doc_scores, mentions, len(target_tokens))
+                        sentiment = self._sentiment(self._normalize(score))
+                        sentiment['text'] = target
+                        response['sentiment']['targets'].append(sentiment)
+            results.append(response)
+        return results
+
+    def _keywords(self, doc, doc_scores):
+        """
+        The most frequent words of the text which are not stopwords or sentiment
+        words, with the sentiment of their context
+        """
+        first_positions = {}
+        for position, token in enumerate(doc):
+            first_positions.setdefault(token, position)
+        counts = Counter(token for token in doc
+                         if len(token) > 2 and not token.isdigit() and
+                         token not in STOPWORDS and token not in BOOSTERS and
+                         self.lookup(token) is None)
+        if not counts:
+            return []
+
+        top = sorted(counts.items(), key=lambda item: (-item[1], first_positions[item[0]]))[:self.KEYWORDS_LIMIT]
+        keywords = []
+        for token, count in top:
+            mentions = [position for position, word in enumerate(doc) if word == token]
+            score = self._normalize(self._window_score(doc_scores, mentions, 1))
+            keywords.append({'text': token,
+                             'sentiment': {'score': round(float(score), 6)},
+                             'relevance': round(float(count) / top[0][1], 6)})
+        return keywords
+
+    @staticmethod
+    def _find(doc, target_tokens):
+        if not target_tokens:
+            return []
+        size = len(target_tokens)
+        return [position for position in range(len(doc) - size + 1)
+                if doc[position:position + size] == target_tokens]
+
+    def _window_score(self, doc_scores, mentions, size):
+        window = np.zeros(len(doc_scores), dtype=bool)
+        for position in mentions:
+            window[max(position - self.WINDOW, 0):position + size + self.WINDOW] = True
+        return doc_scores[window].sum()
+
+    def _normalize(self, total):
+        return total / np.sqrt(total * total + self.ALPHA)
+
+    @staticmethod
+    def _sentiment(score):
+        score = float(score)
+        if score > 0.05:
+            label = 'positive'
+        elif score < -0.05:
+            label = 'negative'
+        else:
+            label = 'neutral'
+        return {'score': round(score, 6), 'label': label}
@@ -4,12 +4,26 @@ from main.models import Article, Target, UserTarget
 
 
 class ArticleSerializer(serializers.ModelSerializer):
+    # latest report only, annotated on the queryset by the compact API requests
+    last_report = serializers.JSONField(read_only=True)
 
     class Meta:
         model = Article
-        fields = ('url', 'title', 'snippet', 'source', 'published_at', 'sentiment_data')
+        fields = ('url', 'title', 'snippet', 'source', 'published_at', 'sentiment_data',
+                  'last_report')
         # read_only_fields = ('id', )
 
+    def __init__(self, *args, **kwargs):
+        """
+        Takes the optional list of the fields to include
+        """
+        fields = kwargs.pop('fields', None)
+        super(ArticleSerializer, self).__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
 
 class UserTargetSerializer(serializers.ModelSerializer):
     keyword = serializers.CharField(source='target_keyword.keyword')
@@ -0,0 +1,40 @@
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_pooled_requests = None
+
+
+class PooledRequests(object):
+    """
+    Stand-in for the requests module used by the API clients SDKs, which
+    otherwise open a new connection for every call: all the requests go through
+    a shared session keeping a pool of connections alive for each host
+    """
+
+    def __init__(self, pool_size):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __getattr__(self, name):
+        # anything else (codes, utils, exceptions..) comes from the requests module
+        return getattr(requests, name)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method=method, url=url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+
+def use_pooled_session(module):
+    """
+    Makes the given SDK module send its requests through the process wide
+    pooled session
+    """
+    global _pooled_requests
+    if _pooled_requests is None:
+        _pooled_requests = PooledRequests(settings.HTTP_POOL_SIZE)
+    module.requests = _pooled_requests
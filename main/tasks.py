@@ -1,77 +1,214 @@
 import logging
-from datetime import datetime, timedelta
+import socket
+import time
+from datetime import timedelta
 
 from celery import shared_task
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils import timezone
+from django.utils.module_loading import import_string
 
-from main.fetchers import NewsAPIScraper, NewsNLUAnalyzer
-from main.models import Article, Target
+from main.cache import NLUResponseCache
+from main.circuit import ServiceUnavailable
+from main.fetchers import NewsAPIScraper
+from main.metrics import metrics
+from main.models import Target
+from main.pipeline import analyze_batch
 
 log = logging.getLogger(__name__)
 
+# cheap to create: their API clients are only built on first use, so each worker
+# process (after the fork) builds its own and reuses it for all its tasks
 news_scraper = NewsAPIScraper()
-news_analyzer = NewsNLUAnalyzer()
+news_analyzer = import_string(settings.SENTIMENT_ANALYZER)()
+
+# label of the analysis throughput metrics of this worker
+WORKER_NAME = socket.gethostname()
 
 
 @shared_task
 def scrape_and_analyze_news_task():
     """
-    Loop over all the target keywords that need to be refreshed and submit the scraping task
+    Submit the scraping task for all the target keywords that need to be refreshed,
+    the most overdue first.
+    The targets are claimed REFRESH_BATCH_SIZE at a time with SELECT ... FOR UPDATE SKIP LOCKED
+    and a single update of their expiration time, so concurrent runs never submit the same keyword.
+    Nothing is done with NEWSAPI_SHARED_HEADLINES enabled: the keywords are scraped by
+    scrape_shared_headlines_task on its own schedule instead
     """
-    now = timezone.now()
-    expired_targets = Target.objects.filter(Q(expired_at__isnull=True) | Q(expired_at__lte=now))
-    log.debug("start scrape and analyze task for %d expired keywords" % len(expired_targets))
+    if settings.NEWSAPI_SHARED_HEADLINES:
+        return
 
-    for target in expired_targets:
-        # submit the target keyword for scraping
-        scrape_latest_news_task.delay(keyword=target.keyword)
+    count = 0
+    while True:
+        keywords = claim_expired_targets(settings.REFRESH_BATCH_SIZE)
+        for keyword in keywords:
+            # submit the target keyword for scraping
+            scrape_latest_news_task.delay(keyword=keyword)
+        count += len(keywords)
 
-        # set the new expiration time
-        target.expired_at = now + timedelta(hours=target.refresh_frequency)
-        target.save()
+        if len(keywords) < settings.REFRESH_BATCH_SIZE:
+            break
+    log.debug("submitted scrape and analyze task for %d expired keywords" % count)
 
 
-@shared_task
-def scrape_latest_news_task(keyword):
+def claim_expired_targets(limit):
     """
-    Scrape for the latest articles containing the given keyword and submit the sentiment analysis task for each article
+    Lock up to limit expired targets, skipping the ones locked by a concurrent run, and
+    move their expiration time one refresh interval ahead (adapted by the scraping task
+    once it's done), within the REFRESH_MIN_INTERVAL and REFRESH_MAX_INTERVAL bounds.
+    Returns the keywords claimed
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed = Target.objects.select_for_update(skip_locked=True)\
+            .filter(Q(expired_at__isnull=True) | Q(expired_at__lte=now))\
+            .order_by(F('expired_at').asc(nulls_first=True), 'id')\
+            .values_list('id', 'keyword')[:limit]
+        claimed = list(claimed)
+        if not claimed:
+            return []
+
+        refresh_interval = Least(Greatest(Coalesce('refresh_interval', F('refresh_frequency') * 60),
+                                          Value(settings.REFRESH_MIN_INTERVAL)),
+                                 Value(settings.REFRESH_MAX_INTERVAL))
+        Target.objects.filter(id__in=[target_id for target_id, _ in claimed])\
+            .update(expired_at=ExpressionWrapper(Value(now) + refresh_interval * Value(timedelta(minutes=1)),
+                                                 output_field=DateTimeField()))
+
+    return [keyword for _, keyword in claimed]
+
+
+@shared_task(bind=True, max_retries=settings.API_RATE_LIMIT_MAX_RETRIES)
+def scrape_latest_news_task(self, keyword):
+    """
+    Scrape for the latest articles containing the given keyword and submit their sentiment analysis in batches
     """
     log.debug("start scraping news for target kw %s" % keyword)
 
-    new_articles_uids = news_scraper.fetch_and_store(query=keyword)
+    try:
+        new_articles_uids = news_scraper.fetch_and_store(query=keyword)
+    except ServiceUnavailable as e:
+        raise self.retry(exc=e, countdown=e.retry_delay(self.request.retries))
     log.debug("scraped %s articles" % len(new_articles_uids))
 
-    for uid in new_articles_uids:
-        analyze_news_task.delay(uid, keyword)
+    # refresh the keyword more or less often depending on the new articles found
+    target = Target.objects.filter(keyword=keyword).first()
+    if target:
+        target.schedule_next_refresh(len(new_articles_uids))
 
+    submit_analysis(new_articles_uids, keyword)
 
-@shared_task
-def scrape_historic_news_task(keyword):
+
+@shared_task(bind=True, max_retries=settings.API_RATE_LIMIT_MAX_RETRIES)
+def scrape_shared_headlines_task(self):
+    """
+    Scrape the latest headlines once for all the target keywords, match the active keywords
+    locally and submit the sentiment analysis of the matching articles in batches.
+    Scheduled hourly, it does nothing unless NEWSAPI_SHARED_HEADLINES is enabled
+    """
+    if not settings.NEWSAPI_SHARED_HEADLINES:
+        return
+
+    keywords = set(Target.objects.filter(active=True).values_list('keyword', flat=True))
+    log.debug("start scraping shared headlines for %d keywords" % len(keywords))
+
+    try:
+        matches = news_scraper.fetch_and_match(keywords)
+    except ServiceUnavailable as e:
+        raise self.retry(exc=e, countdown=e.retry_delay(self.request.retries))
+    log.debug("matched %s article keywords" % len(matches))
+
+    # a single analysis for each article with all its matching keywords,
+    # batched with the articles matching the same keywords
+    article_keywords = {}
+    for uid, keyword in matches:
+        article_keywords.setdefault(uid, set()).add(keyword)
+    keywords_articles = {}
+    for uid, keywords in article_keywords.items():
+        keywords_articles.setdefault(tuple(sorted(keywords)), []).append(uid)
+
+    for keywords, uids in keywords_articles.items():
+        submit_analysis(uids, list(keywords))
+
+
+@shared_task(bind=True, max_retries=settings.API_RATE_LIMIT_MAX_RETRIES)
+def scrape_historic_news_task(self, keyword):
     """
     Scrape for articles containing the given keyword in the last 30 days
-    and submit the sentiment analysis task for each article
+    and submit their sentiment analysis in batches.
+    The backfill resumes from the last checkpoint of the target if it was interrupted
+    (e.g. when retried because of the rate limit)
     """
     log.debug("start scraping news for target kw %s" % keyword)
 
-    upto_date = datetime.now() + timedelta(days=-30)
-    new_articles_uids = news_scraper.fetch_and_store(query=keyword, upto_date=upto_date)
-    log.debug("scraped %s articles" % len(new_articles_uids))
+    target = Target.objects.filter(keyword=keyword).first()
+    if not target:
+        return
+
+    count = 0
+    try:
+        for new_articles_uids in news_scraper.backfill_and_store(target):
+            count += len(new_articles_uids)
+            submit_analysis(new_articles_uids, keyword)
+    except ServiceUnavailable as e:
+        raise self.retry(exc=e, countdown=e.retry_delay(self.request.retries))
+    finally:
+        log.debug("scraped %s articles" % count)
 
-    for uid in new_articles_uids:
-        analyze_news_task.delay(uid, keyword)
+
+def submit_analysis(article_uids, keywords):
+    """
+    Submit the sentiment analysis of the given articles for the given keyword (or list
+    of keywords) in chunks of ANALYSIS_CHUNK_SIZE articles, one task for each chunk
+    """
+    article_uids = sorted(article_uids)
+    for start in range(0, len(article_uids), settings.ANALYSIS_CHUNK_SIZE):
+        analyze_news_batch_task.delay(article_uids[start:start + settings.ANALYSIS_CHUNK_SIZE], keywords)
 
 
 @shared_task
-def analyze_news_task(article_uid, keyword):
+def analyze_news_task(article_uid, keywords):
     """
-    Do the sentiment analysis on the given article for the given keyword
+    Former analysis of a single article, kept for the messages still queued:
+    analyzed as a batch of one
     """
-    log.debug("start analyzing %s with kw %s" % (article_uid, keyword))
+    analyze_news_batch_task(article_uids=[article_uid], keywords=keywords)
+
 
+@shared_task
+def analyze_news_batch_task(article_uids, keywords, attempt=0):
+    """
+    Do the sentiment analysis on the given articles for the given keyword
+    (or list of keywords), keeping up to NLU_CONCURRENCY requests in flight.
+    The articles are loaded with a single query and their results stored at once.
+    The articles not analyzed because the API is unavailable are retried with an
+    exponential backoff, up to API_RATE_LIMIT_MAX_RETRIES times
+    """
+    log.debug("start analyzing %d articles with kw %s" % (len(article_uids), keywords))
+
+    started = time.perf_counter()
+    analyzed = 0
     try:
-        article = Article.objects.get(uid=article_uid)
-    except Article.DoesNotExist:
-        return
-    else:
-        news_analyzer.process_and_store(article, query=keyword)
+        analyzed = analyze_batch(news_analyzer, article_uids, keywords)
+    except ServiceUnavailable as e:
+        if attempt >= settings.API_RATE_LIMIT_MAX_RETRIES:
+            log.error('%s: giving up the analysis of %d articles' % (e, len(e.article_uids)))
+        else:
+            # only the articles left are rescheduled
+            analyze_news_batch_task.apply_async((e.article_uids, keywords, attempt + 1),
+                                                countdown=e.retry_delay(attempt))
+    finally:
+        metrics.inc('mkrk_worker_articles_analyzed_total', analyzed, worker=WORKER_NAME)
+        metrics.inc('mkrk_worker_analysis_seconds_total', time.perf_counter() - started, worker=WORKER_NAME)
+
+
+@shared_task
+def purge_nlu_cache_task():
+    """
+    Evict the expired and exceeding entries of the NLU responses cache
+    """
+    NLUResponseCache.purge()
@@ -1 +1,345 @@
-# Create your tests here.
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from main.circuit import CircuitBreaker, CircuitOpen, ServiceFailure
+from main.fakes import NoCircuitBreaker, NoRateLimit
+from main.fetchers import BaseAnalyzer, NewsAPIScraper
+from main.models import APIService, Article, DailySentiment, SentimentReport, Target
+from main.sentiment import SentimentEngine
+from main.tasks import claim_expired_targets
+from main.utils import minhash, minhash_bands
+
+
+def make_article(n):
+    return Article(url='https://example.com/%d' % n, title='Article %d' % n, snippet='snippet %d' % n,
+                   source='Example', published_at=timezone.make_aware(datetime(2018, 12, 1) + timedelta(hours=n)))
+
+
+class SentimentEngineTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(SentimentEngineTest, cls).setUpClass()
+        cls.engine = SentimentEngine()
+
+    def test_inflected_forms(self):
+        for word, score in (('surges', 2), ('surged', 2), ('surging', 2), ('plunged', -3),
+                            ('losses', -2), ('dropped', -1), ('cutting', -1), ('rallies', 2),
+                            ('fell', -1), ('gains', 2)):
+            self.assertEqual(self.engine.lookup(word), score, word)
+
+    def test_not_in_lexicon(self):
+        for word in ('news', 'business', 'access', 'shares'):
+            self.assertIsNone(self.engine.lookup(word), word)
+
+    def test_inflected_headlines(self):
+        positive, negative = self.engine.analyze(['Chipmaker stock surges as orders rallied',
+                                                  'Retailer plunged after quarterly losses'])
+        self.assertEqual(positive['sentiment']['document']['label'], 'positive')
+        self.assertEqual(negative['sentiment']['document']['label'], 'negative')
+
+
+class ArticleInsertTest(TestCase):
+
+    def test_insert_new_returns_inserted(self):
+        first = [make_article(1), make_article(2)]
+        self.assertEqual(Article.insert_new(first), {article.uid for article in first})
+
+        # the articles already stored are skipped
+        again = [make_article(2), make_article(3), make_article(1)]
+        self.assertEqual(Article.insert_new(again), {again[1].uid})
+        self.assertEqual(Article.objects.count(), 3)
+
+    def test_insert_new_batches(self):
+        articles = [make_article(n) for n in range(5)]
+        Article.insert_new(articles[:2])
+        self.assertEqual(Article.insert_new(articles, batch_size=2), {article.uid for article in articles[2:]})
+        self.assertTrue(Article.objects.filter(uid=articles[4].uid, search_vector__isnull=False).exists())
+
+
+STORY = 'Chipmaker shares surge after the company raised its forecast for the year on strong data center demand'
+
+
+class FindDuplicatesTest(TestCase):
+
+    def make_story(self, n, snippet=STORY):
+        article = make_article(n)
+        article.snippet = snippet
+        article.fingerprint = minhash(article.title.split()[0], snippet, min_shingles=8)
+        article.fingerprint_bands = minhash_bands(article.fingerprint)
+        return article
+
+    def test_published_within_window(self):
+        analyzed = self.make_story(0)
+        Article.insert_new([analyzed])
+        Article.objects.filter(uid=analyzed.uid).update(sentiment_data={'reports': []})
+        later = [self.make_story(24), self.make_story(24 * 5)]
+        Article.insert_new(later)
+        later = list(Article.objects.filter(uid__in=[article.uid for article in later]).order_by('published_at'))
+
+        duplicates = Article.find_duplicates(later)
+        self.assertEqual({article_id: article.uid for article_id, article in duplicates.items()},
+                         {later[0].id: analyzed.uid})
+
+    def test_short_texts_not_fingerprinted(self):
+        self.assertIsNone(minhash('Chipmaker shares surge', None, min_shingles=8))
+        self.assertIsNotNone(minhash('Chipmaker shares surge', STORY, min_shingles=8))
+
+
+def make_report(keyword, score, created_at):
+    return {'target_keyword': keyword, 'target_keyword_score': score, 'global_score': score,
+            'article_keywords_scores': [], 'created_at': created_at}
+
+
+class ArticleReportsTest(TestCase):
+
+    def setUp(self):
+        # bulk created: saving a target schedules its backfill
+        self.apple, self.google = Target.objects.bulk_create([Target(keyword='Apple'), Target(keyword='Google')])
+        article = make_article(1)
+        Article.insert_new([article])
+        self.article = Article.objects.get(uid=article.uid)
+
+    def store(self, *reports):
+        BaseAnalyzer.store_many([(self.article, list(reports))])
+
+    @override_settings(SENTIMENT_REPORTS_PER_KEYWORD=2)
+    def test_retention_per_keyword(self):
+        self.store(make_report('Apple', 0.1, 'a1'), make_report('Google', 0.2, 'g1'))
+        self.store(make_report('Apple', 0.3, 'a2'))
+        # the keywords are matched whatever their case
+        self.store(make_report('APPLE', 0.5, 'a3'))
+
+        stored = Article.objects.get(id=self.article.id).sentiment_data
+        self.assertEqual([report['created_at'] for report in stored['reports']], ['a3', 'a2', 'g1'])
+        # the articles stored are updated with the result
+        self.assertEqual(self.article.sentiment_data, stored)
+
+    @override_settings(SENTIMENT_REPORTS_PER_KEYWORD=0)
+    def test_compact_reports(self):
+        for n in range(4):
+            self.store(make_report('Apple', 0.1, 'a%d' % n), make_report('Google', 0.2, 'g%d' % n))
+
+        self.assertEqual(Article.compact_reports(1, self.article.id, self.article.id + 1), 1)
+        stored = Article.objects.get(id=self.article.id).sentiment_data
+        self.assertEqual([report['created_at'] for report in stored['reports']], ['a3', 'g3'])
+        # already compacted
+        self.assertEqual(Article.compact_reports(1, self.article.id, self.article.id + 1), 0)
+
+    def test_reanalysis_overwrites_report(self):
+        self.store(make_report('Apple', 0.1, 'a1'))
+        self.store(make_report('Apple', 0.5, 'a2'))
+
+        reports = SentimentReport.objects.filter(article=self.article)
+        self.assertEqual([(report.target_keyword_id, report.target_keyword_score) for report in reports],
+                         [(self.apple.id, 0.5)])
+        rollup = DailySentiment.objects.get(target_keyword=self.apple)
+        self.assertEqual((rollup.score_sum, rollup.score_count), (0.5, 1))
+        self.assertFalse(DailySentiment.objects.filter(target_keyword=self.google).exists())
+
+
+class ConcurrentReportsTest(TransactionTestCase):
+
+    def test_concurrent_analyses_counted_once(self):
+        apple, = Target.objects.bulk_create([Target(keyword='Apple')])
+        article = make_article(1)
+        Article.insert_new([article])
+        article = Article.objects.get(uid=article.uid)
+
+        def analyze(score):
+            try:
+                SentimentReport.store_many([(article, [make_report('Apple', score, 'a%s' % score)])])
+            finally:
+                connection.close()
+
+        second = threading.Thread(target=analyze, args=(0.5, ))
+        with transaction.atomic():
+            SentimentReport.store_many([(article, [make_report('Apple', 0.1, 'a1')])])
+            # the second analysis waits for the report inserted by the first one
+            second.start()
+            time.sleep(0.5)
+        second.join()
+
+        rollup = DailySentiment.objects.get(target_keyword=apple)
+        self.assertEqual((rollup.score_sum, rollup.score_count), (0.5, 1))
+
+
+@override_settings(REFRESH_MIN_INTERVAL=15, REFRESH_MAX_INTERVAL=600)
+class ClaimExpiredTargetsTest(TestCase):
+
+    def test_due_targets_claimed_once(self):
+        now = timezone.now()
+        Target.objects.bulk_create([
+            Target(keyword='Apple', refresh_frequency=0),
+            Target(keyword='Google', refresh_interval=30, expired_at=now - timedelta(minutes=1)),
+            Target(keyword='Intel', refresh_frequency=24, expired_at=now - timedelta(minutes=2)),
+            Target(keyword='Tesla', refresh_interval=30, expired_at=now + timedelta(minutes=1)),
+        ])
+
+        self.assertEqual(claim_expired_targets(2), ['Apple', 'Intel'])
+        self.assertEqual(claim_expired_targets(10), ['Google'])
+        self.assertEqual(claim_expired_targets(10), [])
+
+        # moved one interval ahead, within the bounds
+        for keyword, minutes in (('Apple', 15), ('Google', 30), ('Intel', 600)):
+            delay = Target.objects.get(keyword=keyword).expired_at - now
+            self.assertTrue(timedelta(minutes=minutes) <= delay < timedelta(minutes=minutes, seconds=10), keyword)
+
+
+@override_settings(API_CIRCUIT_FAILURES=3, API_CIRCUIT_OPEN_SECONDS=60)
+class CircuitBreakerTest(TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('nlu')
+
+    def fail(self, count):
+        for _ in range(count):
+            self.breaker.allow()
+            self.breaker.record_failure()
+
+    def open_period_elapsed(self):
+        APIService.objects.filter(name='nlu').update(opened_at=F('opened_at') - timedelta(seconds=61))
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.breaker.allow()
+        self.breaker.record_success()
+        # the successes reset the count
+        self.fail(2)
+        self.breaker.allow()
+        self.breaker.record_failure()
+
+        with self.assertRaises(CircuitOpen) as raised:
+            self.breaker.allow()
+        self.assertTrue(59 < raised.exception.retry_after <= 60)
+
+    def test_successful_probe_closes(self):
+        self.fail(3)
+        self.open_period_elapsed()
+        self.breaker.allow()
+        self.breaker.record_success()
+
+        service = APIService.objects.get(name='nlu')
+        self.assertEqual((service.failures, service.opened_at, service.probe_at), (0, None, None))
+        self.breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        self.fail(3)
+        self.open_period_elapsed()
+        self.breaker.allow()
+        self.breaker.record_failure()
+
+        with self.assertRaises(CircuitOpen) as raised:
+            self.breaker.allow()
+        self.assertTrue(59 < raised.exception.retry_after <= 60)
+
+    def test_single_probe(self):
+        self.fail(3)
+        self.open_period_elapsed()
+        other = CircuitBreaker('nlu')
+        self.breaker.allow()
+        with self.assertRaises(CircuitOpen):
+            other.allow()
+
+        # the probe given up is claimed by the next call
+        self.breaker.release_probe()
+        other.allow()
+        with self.assertRaises(CircuitOpen):
+            self.breaker.allow()
+
+
+class RejectingNewsApiClient(object):
+    """
+    NewsAPI client returning 150 results a day (two pages), rejecting the second
+    pages and the days or failing the days given
+    """
+
+    def __init__(self, rejected_days=(), failed_days=()):
+        self.rejected_days = rejected_days
+        self.failed_days = failed_days
+
+    def get_everything(self, **params):
+        from newsapi.newsapi_exception import NewsAPIException
+
+        day = params['from_param'][:10]
+        if params['page'] > 1:
+            raise NewsAPIException({'status': 'error', 'code': 'maximumResultsReached', 'message': 'plan'})
+        if day in self.rejected_days:
+            raise NewsAPIException({'status': 'error', 'code': 'parameterInvalid', 'message': 'too far'})
+        if day in self.failed_days:
+            raise ValueError('not JSON')
+        return {'status': 'ok', 'totalResults': 150, 'articles': [
+            {'url': 'https://example.com/%s/%d' % (day, n), 'title': 'Article %d of %s' % (n, day),
+             'source': {'name': 'Example'}, 'content': None, 'publishedAt': '%sT10:00:00Z' % day}
+            for n in range(2)]}
+
+
+@override_settings(NEWSAPI_BACKFILL_DAYS=2, NEWSAPI_BACKFILL_WORKERS=1)
+class BackfillTest(TestCase):
+
+    def setUp(self):
+        self.target, = Target.objects.bulk_create([Target(keyword='Apple')])
+        self.target.created_at = timezone.make_aware(datetime(2018, 12, 10))
+
+    def backfill(self, api_client):
+        scraper = NewsAPIScraper()
+        scraper.api_client = api_client
+        scraper.rate_limiter, scraper.circuit_breaker = NoRateLimit(), NoCircuitBreaker()
+        return [len(uids) for uids in scraper.backfill_and_store(self.target)]
+
+    def test_rejected_pages_and_days_skipped(self):
+        self.assertEqual(self.backfill(RejectingNewsApiClient(rejected_days=('2018-12-09',))), [2, 0, 2])
+        self.assertEqual(self.target.backfilled_until, datetime(2018, 12, 8).date())
+
+    def test_failed_day_retried(self):
+        with self.assertRaises(ServiceFailure):
+            self.backfill(RejectingNewsApiClient(failed_days=('2018-12-09',)))
+        # resumed from the failed day
+        self.assertEqual(self.target.backfilled_until, datetime(2018, 12, 10).date())
+        self.assertEqual(self.backfill(RejectingNewsApiClient()), [2, 2])
+
+
+class MetricsPageTest(TestCase):
+
+    def test_denied_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_staff_user(self):
+        User.objects.create_user('user', password='password')
+        self.client.login(username='user', password='password')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        User.objects.filter(username='user').update(is_staff=True)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class APIArticleFieldsTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('user', password='password')
+        self.client.login(username='user', password='password')
+
+    def test_known_fields(self):
+        response = self.client.get('/api/v1/article', {'fields': 'url,title'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_fields(self):
+        response = self.client.get('/api/v1/article', {'fields': 'url,body,id'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ["Unknown fields: 'body', 'id'."]})
+
+        for fields in ('', ','):
+            response = self.client.get('/api/v1/article/search', {'q': 'chip', 'fields': fields})
+            self.assertEqual(response.status_code, 400, fields)
@@ -1,32 +1,155 @@
-import pandas as pd
+import hashlib
+import math
+import random
+import re
+import threading
+from datetime import date, datetime, timedelta
+from functools import wraps
+
+from django.db import connection
 
 
 def resample_timeseries(data):
     """
     Function to resample timeseries data wich outputs 1 day data point using
-    the average value of the day
+    the average value of the day, the days without data have a 0 value
     :param data: list of tuples (date, score)
     :return: list of tuples (date, score)
     """
-    df = pd.DataFrame.from_records(data, columns=['date', 'score'])
+    days = {}
+    for day, score in data:
+        if isinstance(day, datetime):
+            day = day.date()
+        elif not isinstance(day, date):
+            day = datetime.strptime(str(day)[:10], '%Y-%m-%d').date()
+        days.setdefault(day, []).append(score)
+
+    if not days:
+        return []
+
+    result = []
+    day, last_day = min(days), max(days)
+    while day <= last_day:
+        scores = days.get(day)
+        result.append((day.strftime('%Y-%m-%d'),
+                       math.fsum(scores) / len(scores) if scores else 0.0))
+        day += timedelta(days=1)
+
+    return result
 
-    # convert date column in pandas datetime format
-    df['date'] = pd.to_datetime(df['date'])
 
-    # set it as index
-    df = df.set_index('date')
+def closing_db_connection(func):
+    """
+    Decorator for the functions run by a thread pool: the db connections are
+    per thread, so close the one opened by the function when it is done
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connection.close()
+    return wrapper
 
-    # resample using 1 day bins and taking the average value
-    d2 = df.resample('D').mean()
 
-    # set the nan to 0
-    d2 = d2.fillna(0)
+def close_thread_connections(executor, workers):
+    """
+    Closes the db connection of each thread of a thread pool of the given number
+    of workers, once its jobs are done (before shutting it down): the threads
+    wait for each other so each one runs a single close
+    """
+    barrier = threading.Barrier(workers)
+
+    def close():
+        barrier.wait()
+        connection.close()
+
+    for future in [executor.submit(close) for _ in range(workers)]:
+        future.result()
+
+
+class locked_cached_property(object):
+    """
+    Like django's cached_property, computed once per instance and then reused,
+    but under a lock so the threads using the instance at the same time don't
+    compute it more than once. Assigning the attribute replaces the value
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+        self.lock = threading.Lock()
 
-    # convert the dates into strings
-    d2['date'] = d2.index.to_series()
-    d2['date'] = pd.to_datetime(d2['date'])
-    d2['date'] = d2['date'].dt.strftime('%Y-%m-%d')
-    d2 = d2.set_index('date')
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.func(instance)
+        return instance.__dict__[self.name]
 
-    # return the new data as list of tuples
-    return list(d2.itertuples(name=None))
+
+# MinHash signature: number of hash functions and rows of each LSH band
+MINHASH_SIZE = 32
+MINHASH_BAND_ROWS = 2
+_MERSENNE_PRIME = (1 << 61) - 1
+_minhash_random = random.Random(42)
+_MINHASH_PERMUTATIONS = [(_minhash_random.randrange(1, _MERSENNE_PRIME),
+                          _minhash_random.randrange(0, _MERSENNE_PRIME))
+                         for _ in range(MINHASH_SIZE)]
+
+
+def minhash(*texts, min_shingles=1):
+    """
+    MinHash signature of the word bigrams of the given texts: the fraction of
+    values two signatures have in common estimates the Jaccard similarity of
+    the texts, so a republished story with a slightly different wording gets
+    a similar signature
+    :param texts: strings (None values are skipped)
+    :param min_shingles: minimum number of distinct bigrams, the signatures of
+    shorter texts are too coarse to tell two stories apart
+    :return: list of MINHASH_SIZE int or None if there are not enough words
+    """
+    words = []
+    for text in texts:
+        if text:
+            # drop the '[+1234 chars]' suffix of the NewsAPI truncated content
+            text = re.sub(r'\[\+\d+ chars\]', ' ', text)
+            words += re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+
+    shingles = set(zip(words, words[1:])) if len(words) > 1 else {(words[0], )}
+    if len(shingles) < min_shingles:
+        return None
+    hashes = [int.from_bytes(hashlib.md5(' '.join(shingle).encode('utf-8')).digest()[:8], 'big')
+              for shingle in shingles]
+    return [min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+            for a, b in _MINHASH_PERMUTATIONS]
+
+
+def minhash_bands(signature):
+    """
+    Locality sensitive hashing of a MinHash signature: one key for each band of
+    MINHASH_BAND_ROWS values, so the signatures of similar texts very likely
+    share at least one key and can be found with an index lookup on the keys
+    :param signature: list of int as returned by minhash
+    :return: list of int
+    """
+    if not signature:
+        return None
+    keys = []
+    for start in range(0, len(signature), MINHASH_BAND_ROWS):
+        band = '%d:%s' % (start, signature[start:start + MINHASH_BAND_ROWS])
+        keys.append(int.from_bytes(hashlib.md5(band.encode('utf-8')).digest()[:8], 'big', signed=True))
+    return keys
+
+
+def minhash_similarity(signature1, signature2):
+    """
+    Estimated Jaccard similarity of the texts of two MinHash signatures
+    """
+    if not signature1 or not signature2:
+        return 0.0
+    return sum(1 for h1, h2 in zip(signature1, signature2) if h1 == h2) / float(len(signature1))
@@ -1,10 +1,21 @@
+import heapq
+from datetime import timedelta
+from hmac import compare_digest
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils import timezone
 
-from main.models import Article
+from main.cache import get_keyword_feeds, get_keyword_trends
+from main.live import parse_event_id, stream_events
+from main.metrics import render_metrics
+from main.models import SentimentReport
 from main.utils import resample_timeseries
 
 
@@ -33,27 +44,58 @@ def logout_page(request):
 @login_required(login_url='login')
 def news_page(request):
 
-    user_keywords = list(request.user.my_targets.all().values_list(
-        'target_keyword__keyword', flat=True))
-    user_articles = Article.objects.filter(
-        sentiment_data__reports__0__target_keyword__in=user_keywords)[:100]
-    stats = Article.get_score_averages(user_articles)
+    user_targets = list(request.user.my_targets.all().values_list(
+        'target_keyword', 'target_keyword__keyword',
+        'target_keyword__reports_updated_at'))
+    feeds = get_keyword_feeds([(target_id, updated_at)
+                               for target_id, _, updated_at in user_targets])
+
+    # merge the cached feeds of the keywords, most recent first
+    latest = heapq.merge(*[feed['feed'] for feed in feeds.values()],
+                         key=itemgetter(0), reverse=True)
+    positions = {report_id: n for n, (_, report_id) in enumerate(islice(latest, 100))}
+    user_reports = sorted(SentimentReport.objects.filter(
+        id__in=positions).select_related('article', 'target_keyword'),
+        key=lambda report: positions[report.id])
+    stats = {keyword: feeds[target_id]['average']
+             for target_id, keyword, _ in user_targets
+             if feeds[target_id]['average'][1]}
 
-    return render(request, 'news.html', {'articles': user_articles,
+    return render(request, 'news.html', {'reports': user_reports,
                                          'stats': stats})
 
 
+@login_required(login_url='login')
+def news_stream(request):
+    """
+    Server-sent events of the articles analyzed for the user keywords,
+    resumed after the Last-Event-ID sent by a reconnecting browser
+    """
+    target_ids = request.user.my_targets.values_list('target_keyword', flat=True)
+    last_event_id = parse_event_id(request.META.get('HTTP_LAST_EVENT_ID'))
+
+    response = StreamingHttpResponse(stream_events(list(target_ids), last_event_id),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # not buffered by the proxies
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required(login_url='login')
 def trends_page(request):
-    user_keywords = list(request.user.my_targets.all().values_list(
-        'target_keyword__keyword', flat=True))
-    user_articles = Article.objects.filter(
-        sentiment_data__reports__0__target_keyword__in=user_keywords)[:100]
-    kw_score_timeseries = Article.get_score_data(user_articles)
+    user_targets = list(request.user.my_targets.all().values_list(
+        'target_keyword', 'target_keyword__keyword',
+        'target_keyword__reports_updated_at'))
+    since = timezone.now().date() - timedelta(days=settings.TRENDS_DAYS)
+    kw_score_timeseries = get_keyword_trends(
+        [(target_id, updated_at) for target_id, _, updated_at in user_targets],
+        since)
 
     trends = {}
-    for kw, score_timeseries in kw_score_timeseries.items():
-        trends[kw] = resample_timeseries(score_timeseries)
+    for target_id, kw, _ in user_targets:
+        if kw_score_timeseries[target_id]:
+            trends[kw] = resample_timeseries(kw_score_timeseries[target_id])
     return render(request, 'trends.html', {'trends': trends})
 
 
@@ -61,3 +103,17 @@ def trends_page(request):
 def settings_page(request):
 
     return render(request, 'settings.html')
+
+
+def metrics_page(request):
+    """
+    Pipeline metrics of all the processes in the Prometheus text format,
+    readable with the bearer METRICS_TOKEN or by the staff users only
+    (their keyword labels are the targets of the users)
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not request.user.is_staff and \
+            not (settings.METRICS_TOKEN and compare_digest(authorization, 'Bearer %s' % settings.METRICS_TOKEN)):
+        return HttpResponseForbidden()
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -20,8 +20,18 @@ app.autodiscover_tasks()
 
 # schedule of all the periodic tasks
 app.conf.beat_schedule = {
+    # checks every target keyword due for a refresh
     'news-scraper': {
         'task': 'main.tasks.scrape_and_analyze_news_task',
+        'schedule': crontab(minute='*/15'),
+    },
+    # a single headlines query for all the keywords, with NEWSAPI_SHARED_HEADLINES
+    'shared-headlines-scraper': {
+        'task': 'main.tasks.scrape_shared_headlines_task',
         'schedule': crontab(minute=0, hour='*/1'),
     },
+    'nlu-cache-purge': {
+        'task': 'main.tasks.purge_nlu_cache_task',
+        'schedule': crontab(minute=30, hour=3),
+    },
 }
@@ -185,6 +185,39 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 STATIC_ROOT = os.path.join(PROJECT_ROOT, 'staticfiles')
 STATIC_URL = '/static/'
 
+# number of days shown in the trends page
+TRENDS_DAYS = int(os.getenv('TRENDS_DAYS', 30))
+# dashboards data cached by target keyword: number of reports of each
+# keyword feed and seconds before expiring
+DASHBOARD_FEED_SIZE = int(os.getenv('DASHBOARD_FEED_SIZE', 100))
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 3600))
+# text search configuration (language) of the articles full-text search
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'english')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mkrk',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# bearer token required to read the /metrics endpoint (only the staff users can if not set)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', None)
+
+# live news stream: seconds between the keepalive comments of an idle stream
+# and before reconnecting, events queued for a slow client and events replayed
+# to a client reconnecting
+LIVE_KEEPALIVE = int(os.getenv('LIVE_KEEPALIVE', 15))
+LIVE_RECONNECT_DELAY = int(os.getenv('LIVE_RECONNECT_DELAY', 5))
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 100))
+LIVE_MAX_MISSED_EVENTS = int(os.getenv('LIVE_MAX_MISSED_EVENTS', 100))
+# seconds before a stream is ended (the browser reconnects and resumes from its
+# last event) and streams open at the same time in each web process, which must
+# leave some of the gunicorn threads (see Procfile) to the other requests
+LIVE_MAX_STREAM_SECONDS = int(os.getenv('LIVE_MAX_STREAM_SECONDS', 300))
+LIVE_MAX_STREAMS = int(os.getenv('LIVE_MAX_STREAMS', 25))
+
 # Celery settings
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_IGNORE_RESULT = True
@@ -206,6 +239,66 @@ if CELERY_BROKER_URL:
     # Disable prefetching, it's causes problems and doesn't help performance
     CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
+# class of the sentiment analyzer: main.fetchers.NewsNLUAnalyzer (IBM NLU service)
+# or main.fetchers.LocalSentimentAnalyzer (in-process lexicon, no network)
+SENTIMENT_ANALYZER = os.getenv('SENTIMENT_ANALYZER', 'main.fetchers.NewsNLUAnalyzer')
 IBM_NLU_APIKEY = os.getenv('IBM_NLU_APIKEY', None)
 IBM_NLU_URL = os.getenv('IBM_NLU_URL', None)
+# adaptive refresh of the target keywords: minimum and maximum number of
+# minutes between refreshes, new articles expected from each refresh and
+# number of keywords claimed at once by the scheduler
+REFRESH_MIN_INTERVAL = int(os.getenv('REFRESH_MIN_INTERVAL', 15))
+REFRESH_MAX_INTERVAL = int(os.getenv('REFRESH_MAX_INTERVAL', 60 * 12))
+REFRESH_TARGET_YIELD = int(os.getenv('REFRESH_TARGET_YIELD', 5))
+REFRESH_BATCH_SIZE = int(os.getenv('REFRESH_BATCH_SIZE', 100))
+# near duplicate articles reuse the reports of the analyzed article with the
+# most similar title+snippet: minimum estimated similarity, maximum number of
+# candidates compared, days between their publication dates and minimum number
+# of word bigrams of a fingerprinted title+snippet
+DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', 0.7))
+DUPLICATE_MAX_CANDIDATES = int(os.getenv('DUPLICATE_MAX_CANDIDATES', 100))
+DUPLICATE_WINDOW_DAYS = int(os.getenv('DUPLICATE_WINDOW_DAYS', 2))
+DUPLICATE_MIN_SHINGLES = int(os.getenv('DUPLICATE_MIN_SHINGLES', 8))
+# reports kept in the history of each article for each target keyword (0 keeps them all)
+SENTIMENT_REPORTS_PER_KEYWORD = int(os.getenv('SENTIMENT_REPORTS_PER_KEYWORD', 10))
+# articles analyzed by each batch analysis task
+ANALYSIS_CHUNK_SIZE = int(os.getenv('ANALYSIS_CHUNK_SIZE', 50))
+# maximum number of NLU requests in flight for each batch analysis task
+NLU_CONCURRENCY = int(os.getenv('NLU_CONCURRENCY', 20))
+# NLU responses cache: hours before expiring and maximum number of entries
+NLU_CACHE_TTL = int(os.getenv('NLU_CACHE_TTL', 24 * 30))
+NLU_CACHE_MAX_ENTRIES = int(os.getenv('NLU_CACHE_MAX_ENTRIES', 100000))
+# budget of each external API shared by all the workers:
+# (calls per second, burst of calls allowed)
+API_RATE_LIMITS = {
+    'newsapi': (float(os.getenv('NEWSAPI_CALLS_PER_DAY', 1000)) / 86400,
+                int(os.getenv('NEWSAPI_BURST', 50))),
+    'nlu': (float(os.getenv('IBM_NLU_CALLS_PER_MINUTE', 60)) / 60,
+            int(os.getenv('IBM_NLU_BURST', 20))),
+}
+# seconds a call waits for the rate limit before the task is rescheduled
+API_RATE_LIMIT_MAX_WAIT = int(os.getenv('API_RATE_LIMIT_MAX_WAIT', 10))
+API_RATE_LIMIT_MAX_RETRIES = int(os.getenv('API_RATE_LIMIT_MAX_RETRIES', 20))
+# circuit breaker of each external API: consecutive failed calls opening it
+# and seconds before a probe call is let through
+API_CIRCUIT_FAILURES = int(os.getenv('API_CIRCUIT_FAILURES', 5))
+API_CIRCUIT_OPEN_SECONDS = int(os.getenv('API_CIRCUIT_OPEN_SECONDS', 60))
+# exponential backoff of the tasks retried after a failed call:
+# seconds before the first retry and maximum seconds between retries
+API_RETRY_BASE_DELAY = int(os.getenv('API_RETRY_BASE_DELAY', 30))
+API_RETRY_MAX_DELAY = int(os.getenv('API_RETRY_MAX_DELAY', 3600))
+# keep-alive connections kept open per host by the API clients
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
 NEWSAPIORG_APIKEY = os.getenv('NEWSAPIORG_APIKEY', None)
+# article uids remembered by each worker to skip the articles already stored:
+# seconds and maximum number of uids
+INGEST_RECENT_UIDS_TTL = int(os.getenv('INGEST_RECENT_UIDS_TTL', 60 * 60 * 6))
+INGEST_RECENT_UIDS_MAX_SIZE = int(os.getenv('INGEST_RECENT_UIDS_MAX_SIZE', 100000))
+# fetch the source headlines once an hour and match all the keywords locally
+# instead of querying NewsAPI once per target keyword
+NEWSAPI_SHARED_HEADLINES = os.getenv('NEWSAPI_SHARED_HEADLINES', '0') == '1'
+# historic backfill of a new keyword: days fetched, parallel daily slices
+# and maximum number of result pages per slice
+NEWSAPI_BACKFILL_DAYS = int(os.getenv('NEWSAPI_BACKFILL_DAYS', 30))
+NEWSAPI_BACKFILL_WORKERS = int(os.getenv('NEWSAPI_BACKFILL_WORKERS', 4))
+NEWSAPI_MAX_PAGES = int(os.getenv('NEWSAPI_MAX_PAGES', 10))
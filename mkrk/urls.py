@@ -10,6 +10,7 @@ urlpatterns = [
     path('', views.login_page, name='login'),
     path('logout', views.logout_page, name='logout'),
     path('dashboard/news', views.news_page, name='news'),
+    path('dashboard/news/stream', views.news_stream, name='news_stream'),
     path('dashboard/trends', views.trends_page, name='trends'),
     path('dashboard/settings', views.settings_page, name='settings'),
 
@@ -17,4 +18,8 @@ urlpatterns = [
     path('api/v1/usertarget', api.APIUserTarget.as_view(),
          name='api_usertarget'),
     path('api/v1/article', api.APIArticle.as_view(), name='api_article'),
+    path('api/v1/article/search', api.APIArticleSearch.as_view(), name='api_article_search'),
+
+    # Prometheus metrics
+    path('metrics', views.metrics_page, name='metrics'),
 ]